@@ -22,7 +22,9 @@ const storage = multer.diskStorage({
     cb(null, path.join(__dirname, "uploads"));
   },
   filename: function (req, file, cb) {
-    cb(null, "uploaded_file.xlsx");
+    // Ekspor CSV/TSV disimpan dengan ekstensinya agar prepare_data.py membacanya sebagai teks
+    const ext = path.extname(file.originalname).toLowerCase();
+    cb(null, [".csv", ".tsv", ".txt"].includes(ext) ? `uploaded_file${ext}` : "uploaded_file.xlsx");
   },
 });
 
@@ -96,6 +98,27 @@ app.get("/uploads/excel-file/data_view_jeniskelamin", (req, res) => {
 });
 
 
+// Endpoint untuk salinan JSON (gzip) dari data_view*.xlsx, dirender langsung oleh halaman peta
+app.get("/uploads/json-file/:view", (req, res) => {
+  const view = req.params.view;
+  if (!/^data_view(_[a-z]+)?$/.test(view)) {
+    return res.status(404).send("File not found.");
+  }
+
+  const filePath = path.join(__dirname, "uploads", `${view}.json.gz`);
+
+  if (!fs.existsSync(filePath)) {
+    return res.status(404).send("File not found.");
+  }
+
+  // File sudah di-gzip oleh prepare_data.py; browser mendekompresinya sendiri
+  res.set({
+    "Content-Type": "application/json; charset=utf-8",
+    "Content-Encoding": "gzip",
+    "Cache-Control": "no-cache",
+  });
+  res.sendFile(filePath);
+});
 
 // Last update harus mengambil dari data_view.xlsx
 app.get("/uploads/excel-file/last-update", (req, res) => {
@@ -123,7 +146,14 @@ app.post("/upload", upload.single("file"), (req, res) => {
 
   console.log("Menjalankan prepare_data.py...");
   const pythonScriptPath = path.join(__dirname, "uploads", "prepare_data.py");
-  const pythonProcess = spawn("python3", [pythonScriptPath]);
+  // POST /upload?append=1 hanya menambahkan periode (BULAN/TAHUN) baru ke data sebelumnya
+  const pythonArgs = [pythonScriptPath, "--upload", req.file.path];
+  if (req.query.append === "1") {
+    pythonArgs.push("--append");
+  }
+  // Waktu mulai, untuk mencatat durasi prepare_data.py (fase baca dan tulis dicetak oleh script)
+  const startedAt = Date.now();
+  const pythonProcess = spawn("python3", pythonArgs);
 
   let outputData = "";
   let errorData = "";
@@ -139,7 +169,7 @@ app.post("/upload", upload.single("file"), (req, res) => {
   });
 
   pythonProcess.on("close", (code) => {
-    console.log(`prepare_data.py selesai dengan kode ${code}`);
+    console.log(`prepare_data.py selesai dengan kode ${code} dalam ${Date.now() - startedAt} ms`);
 
     if (code === 0) {
       // Cek apakah data_view.xlsx ada setelah proses selesai
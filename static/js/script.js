@@ -79,6 +79,37 @@ $(document).ready(function () {
     });
   });
 
+  // Ambil tabel view sebagai array baris (baris pertama = header), sama seperti
+  // XLSX.utils.sheet_to_json(sheet, { header: 1 }). Memakai salinan JSON (gzip)
+  // dari prepare_data.py; kembali ke file xlsx bila JSON belum tersedia.
+  function fetchViewRows(view) {
+    return fetch(`http://${serverIP}:3000/uploads/json-file/${view}`)
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`JSON for ${view} not found`);
+        }
+        return response.json();
+      })
+      .then((payload) => {
+        var rows = [payload.columns];
+        for (var r = 0; r < payload.rows; r++) {
+          rows.push(payload.data.map((column) => column[r]));
+        }
+        return rows;
+      })
+      .catch(() => {
+        var excelPath = view === "data_view" ? "" : `/${view}`;
+        return fetch(`http://${serverIP}:3000/uploads/excel-file${excelPath}`)
+          .then((response) => response.arrayBuffer())
+          .then((buffer) => {
+            var data = new Uint8Array(buffer);
+            var workbook = XLSX.read(data, { type: "array" });
+            var sheet = workbook.Sheets[workbook.SheetNames[0]];
+            return XLSX.utils.sheet_to_json(sheet, { header: 1 });
+          });
+      });
+  }
+
   function loadExcelFromServer() {
     fetch(`http://${serverIP}:3000/uploads/excel-file/last-update`)
       .then((response) => response.json())
@@ -91,14 +122,9 @@ $(document).ready(function () {
       })
       .then((data) => {
         $("#last-update").text(new Date(data.lastModified).toLocaleString());
-        return fetch(`http://${serverIP}:3000/uploads/excel-file`);
+        return fetchViewRows("data_view");
       })
-      .then((response) => response.arrayBuffer())
-      .then((buffer) => {
-        var data = new Uint8Array(buffer);
-        var workbook = XLSX.read(data, { type: "array" });
-        var sheet = workbook.Sheets[workbook.SheetNames[0]];
-        var jsonData = XLSX.utils.sheet_to_json(sheet, { header: 1 });
+      .then((jsonData) => {
 
         var headerRow = jsonData[0];
 
@@ -127,6 +153,16 @@ $(document).ready(function () {
           autoWidth: false,  // Optional: prevent automatic width calc
         });
 
+        // Indeks baris per LOKASI (kolom 3), dibangun sekali saat tabel dimuat,
+        // agar klik peta tidak perlu mencari di seluruh baris. Kunci diambil dari
+        // nilai mentah JSON (bukan HTML sel) supaya sama dengan record ringkasan.
+        viewRows = table.rows({ order: "index" }).data().toArray();
+        rowsByLokasi = {};
+        viewRows.forEach((rowData, i) => {
+          var lokasi = jsonData[i + 1][3];
+          (rowsByLokasi[lokasi] = rowsByLokasi[lokasi] || []).push(rowData);
+        });
+
         if (headerRow[0] != "File not found.") {
           let modelDownloadLink = `http://${serverIP}:3000/uploads/data_view.xlsx`;
           $(`#view-download-link`).attr("href", modelDownloadLink);
@@ -142,13 +178,8 @@ $(document).ready(function () {
   loadExcelFromServer();
 
   function loadViewTingkat() {
-    fetch(`http://${serverIP}:3000/uploads/excel-file/data_view_tingkat`)
-      .then((response) => response.arrayBuffer())
-      .then((buffer) => {
-        var data = new Uint8Array(buffer);
-        var workbook = XLSX.read(data, { type: "array" });
-        var sheet = workbook.Sheets[workbook.SheetNames[0]];
-        var jsonData = XLSX.utils.sheet_to_json(sheet, { header: 1 });
+    fetchViewRows("data_view_tingkat")
+      .then((jsonData) => {
 
         var headerRow = jsonData[0];
         // Destroy existing DataTable if it exists
@@ -189,13 +220,8 @@ $(document).ready(function () {
   }
 
   function loadViewLokasi() {
-    fetch(`http://${serverIP}:3000/uploads/excel-file/data_view_lokasi`)
-      .then((response) => response.arrayBuffer())
-      .then((buffer) => {
-        var data = new Uint8Array(buffer);
-        var workbook = XLSX.read(data, { type: "array" });
-        var sheet = workbook.Sheets[workbook.SheetNames[0]];
-        var jsonData = XLSX.utils.sheet_to_json(sheet, { header: 1 });
+    fetchViewRows("data_view_lokasi")
+      .then((jsonData) => {
 
         var headerRow = jsonData[0];
         // Destroy existing DataTable if it exists
@@ -234,13 +260,8 @@ $(document).ready(function () {
       });
   }
   function loadViewProvinsi() {
-    fetch(`http://${serverIP}:3000/uploads/excel-file/data_view_provinsi`)
-      .then((response) => response.arrayBuffer())
-      .then((buffer) => {
-        var data = new Uint8Array(buffer);
-        var workbook = XLSX.read(data, { type: "array" });
-        var sheet = workbook.Sheets[workbook.SheetNames[0]];
-        var jsonData = XLSX.utils.sheet_to_json(sheet, { header: 1 });
+    fetchViewRows("data_view_provinsi")
+      .then((jsonData) => {
 
         var headerRow = jsonData[0];
         // Destroy existing DataTable if it exists
@@ -280,13 +301,8 @@ $(document).ready(function () {
   }
 
   function loadViewStatus() {
-    fetch(`http://${serverIP}:3000/uploads/excel-file/data_view_status`)
-      .then((response) => response.arrayBuffer())
-      .then((buffer) => {
-        var data = new Uint8Array(buffer);
-        var workbook = XLSX.read(data, { type: "array" });
-        var sheet = workbook.Sheets[workbook.SheetNames[0]];
-        var jsonData = XLSX.utils.sheet_to_json(sheet, { header: 1 });
+    fetchViewRows("data_view_status")
+      .then((jsonData) => {
 
         var headerRow = jsonData[0];
         // Destroy existing DataTable if it exists
@@ -326,13 +342,8 @@ $(document).ready(function () {
   }
 
   function loadViewJenisKelamin() {
-    fetch(`http://${serverIP}:3000/uploads/excel-file/data_view_jeniskelamin`)
-      .then((response) => response.arrayBuffer())
-      .then((buffer) => {
-        var data = new Uint8Array(buffer);
-        var workbook = XLSX.read(data, { type: "array" });
-        var sheet = workbook.Sheets[workbook.SheetNames[0]];
-        var jsonData = XLSX.utils.sheet_to_json(sheet, { header: 1 });
+    fetchViewRows("data_view_jeniskelamin")
+      .then((jsonData) => {
 
         var headerRow = jsonData[0];
         // Destroy existing DataTable if it exists
@@ -465,12 +476,86 @@ $(document).ready(function () {
   // Sembunyikan tombol reset saat halaman pertama dimuat
   // $("#reset-filter").hide();
 
+  // Ringkasan per wilayah (data_view_regions.json.gz), dimuat sekali dan
+  // dicari berdasarkan title <area> saat peta diklik
+  var regionSummary = null;
+  var viewRows = []; // Semua baris data_view
+  var rowsByLokasi = {}; // LOKASI -> baris data_view dengan LOKASI tersebut
+  var regionFiltered = false; // Tabel sedang menampilkan satu wilayah
+
+  function loadRegionSummary() {
+    fetch(`http://${serverIP}:3000/uploads/json-file/data_view_regions`)
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => {
+        regionSummary = data;
+      })
+      .catch((error) => {
+        console.error("Error loading region summary: ", error);
+      });
+  }
+
+  loadRegionSummary();
+
+  // Record ringkasan untuk title <area>, atau null bila belum/tidak tersedia
+  function findRegion(title) {
+    if (!regionSummary) {
+      return null;
+    }
+    return (
+      regionSummary.regions[title] ||
+      regionSummary.regions[regionSummary.aliases[title]] ||
+      null
+    );
+  }
+
+  function showRegionSummary(region) {
+    if (!region) {
+      $("#region-summary").empty();
+      return;
+    }
+
+    $("#region-summary").html(`
+      <p>Jumlah pegawai: <b>${Number(region.employees)}</b>,
+        total dokumen: <b>${Number(region.total_documents)}</b>,
+        kelengkapan: <b>${Number(region.completeness)}%</b></p>
+      <p>Pegawai dengan dokumen lengkap: <b>${Number(region.distribution[region.distribution.length - 1])}</b></p>
+    `);
+    if (region.top_units.length) {
+      // Nama unit berasal dari data upload: isi lewat .text() agar tidak dibaca sebagai HTML
+      var units = $("<ul>").append(
+        region.top_units.map((unit) =>
+          $("<li>").text(`${unit.unit}: ${unit.employees} pegawai (${unit.completeness}%)`)
+        )
+      );
+      $("#region-summary").append($("<p>").text("Unit kerja terbesar:"), units);
+    }
+  }
+
+  // Isi tabel dengan baris yang diberikan (tanpa pencarian di seluruh baris)
+  function showRows(rows) {
+    table.clear().rows.add(rows).draw();
+  }
+
   $("area").on("click", function (event) {
     event.preventDefault();
     const city = $(this).data("city");
+    const region = findRegion($(this).attr("title"));
     $("#selected-city").text("Filter Kota: " + city);
+    showRegionSummary(region);
 
-    table.column(3).search(city).draw();
+    if (region) {
+      // Nilai LOKASI wilayah ini sudah ada di record: ambil barisnya dari indeks
+      regionFiltered = true;
+      table.column(3).search("");
+      showRows(region.lokasi.flatMap((lokasi) => rowsByLokasi[lokasi] || []));
+    } else {
+      // Ringkasan belum dimuat: kembali ke pencarian kolom
+      if (regionFiltered) {
+        regionFiltered = false;
+        table.clear().rows.add(viewRows);
+      }
+      table.column(3).search(city).draw();
+    }
     if (city) {
       $("#reset-filter").show();
     }
@@ -478,14 +563,21 @@ $(document).ready(function () {
 
   $("#reset-filter").on("click", function () {
     $("#selected-city").text("Menampilkan Semua Kota");
-    table.column(3).search("").draw(); // Menghapus filter
+    $("#region-summary").empty();
+    if (regionFiltered) {
+      regionFiltered = false;
+      table.column(3).search("");
+      showRows(viewRows); // Kembalikan semua baris
+    } else {
+      table.column(3).search("").draw(); // Menghapus filter
+    }
 
     // ✅ Perbaikan: gunakan `$(this)`, bukan `$$(this)`
     // $(this).hide();
   });
 
   table.on("draw", function () {
-    let filterApplied = table.column(3).search() !== "";
+    let filterApplied = regionFiltered || table.column(3).search() !== "";
     $("#reset-filter").toggle(filterApplied);
   });
 
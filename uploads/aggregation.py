@@ -0,0 +1,186 @@
+# ==============================
+# SINGLE-PASS AGGREGATION ENGINE
+# ==============================
+
+import numpy as np
+import pandas as pd
+
+from data_snapshot import to_json_value
+from snapshot_meta import read_npz_meta, save_npz
+
+# Number of rows (employees) behind each cell, kept next to the document sums
+ROW_COUNT = 'JUMLAH PEGAWAI'
+
+
+def coerce_doc_matrix(df, doc_columns):
+    """Convert the document columns to one integer matrix (non-numeric values become 0)."""
+    doc_frame = df[doc_columns]
+    if all(dtype.kind in "iu" for dtype in doc_frame.dtypes):
+        # Already parsed to integer flags on upload
+        return doc_frame.astype(int)
+    return df[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
+
+
+def encode_with(encoder, series):
+    """Encode `series` with a running value -> code dictionary shared across chunks."""
+    codes, uniques = pd.factorize(series)
+    lookup = np.array([encoder.setdefault(value, len(encoder)) for value in uniques], dtype=np.int32)
+    return lookup[codes]
+
+
+class CellAccumulator:
+    """
+    Running document sums and row counts per distinct `group_cols` combination.
+
+    Rows can be added in one go or chunk by chunk; each chunk is grouped once at
+    the finest grain and merged into the running cells, so memory is bounded by
+    the number of distinct combinations rather than the number of rows. The
+    cells form a cube: any roll-up over a subset of `group_cols` is answered from
+    them (see `rollup`). Grouping columns must not contain NaN (rows are filled
+    with 0 before aggregating).
+    """
+
+    def __init__(self, doc_columns, group_cols):
+        self.doc_columns = list(doc_columns)
+        self.group_cols = list(group_cols)
+        self.encoders = {col: {} for col in self.group_cols}
+        self.cells = None
+        self._ranked = None
+
+    def add(self, df):
+        doc_matrix = coerce_doc_matrix(df, self.doc_columns)
+        doc_matrix[ROW_COUNT] = 1
+        code_frame = pd.DataFrame(
+            {col: encode_with(self.encoders[col], df[col]) for col in self.group_cols},
+            index=df.index,
+        )
+
+        # One groupby over the rows at the finest grain
+        chunk_cells = pd.concat([code_frame, doc_matrix], axis=1).groupby(self.group_cols, sort=False)[self.doc_columns + [ROW_COUNT]].sum()
+        self._merge_cells(chunk_cells)
+
+    def merge(self, other):
+        """Add the cells of another accumulator (e.g. one built in a worker process) to these."""
+        if other.cells is None:
+            return
+        # Translate the other accumulator's codes into ours via the values
+        uniques = other.uniques()
+        index = pd.MultiIndex.from_arrays(
+            [
+                encode_with(self.encoders[col], uniques[col].take(other.cells.index.get_level_values(col)))
+                for col in self.group_cols
+            ],
+            names=self.group_cols,
+        )
+        self._merge_cells(other.cells.set_axis(index))
+
+    def _merge_cells(self, chunk_cells):
+        if self.cells is None:
+            self.cells = chunk_cells
+        else:
+            self.cells = pd.concat([self.cells, chunk_cells]).groupby(level=self.group_cols, sort=False).sum()
+
+    @classmethod
+    def load(cls, file_path):
+        """Restore the running cells saved by `save` (used by append mode)."""
+        with np.load(file_path, allow_pickle=False) as data:
+            if "counts" not in data.files:
+                raise ValueError(f"{file_path} has no row counts; run a full prepare_data.py first")
+            meta = read_npz_meta(data)
+            accumulator = cls(meta["doc_columns"], meta["group_cols"])
+            for col, categories in zip(accumulator.group_cols, meta["categories"]):
+                accumulator.encoders[col] = {value: code for code, value in enumerate(categories)}
+            index = pd.MultiIndex.from_arrays(
+                [data[f"codes_{i}"] for i in range(len(accumulator.group_cols))],
+                names=accumulator.group_cols,
+            )
+            accumulator.cells = pd.DataFrame(data["sums"], index=index, columns=accumulator.doc_columns)
+            accumulator.cells[ROW_COUNT] = data["counts"]
+        return accumulator
+
+    def save(self, file_path):
+        """Persist the running cells so a later upload can be merged into them."""
+        arrays = {
+            f"codes_{i}": self.cells.index.get_level_values(col).to_numpy(np.int32)
+            for i, col in enumerate(self.group_cols)
+        }
+        arrays["sums"] = self.cells[self.doc_columns].to_numpy(np.int64)
+        arrays["counts"] = self.cells[ROW_COUNT].to_numpy(np.int64)
+        meta = {
+            "doc_columns": self.doc_columns,
+            "group_cols": self.group_cols,
+            "categories": [[to_json_value(v) for v in encoder] for encoder in self.encoders.values()],
+        }
+        save_npz(file_path, arrays, meta)
+
+    def drop_periods(self, period_cols, periods):
+        """Remove the cells of the given periods (tuples of `period_cols` values)."""
+        if self.cells is None or not periods:
+            return
+        uniques = self.uniques()
+        keys = pd.MultiIndex.from_arrays(
+            [uniques[col].take(self.cells.index.get_level_values(col)) for col in period_cols]
+        )
+        self.cells = self.cells[~keys.isin(list(periods))]
+
+    def uniques(self):
+        return {col: pd.Index(list(encoder)) for col, encoder in self.encoders.items()}
+
+    def _ranked_cells(self):
+        # Re-number each column's codes so they follow the sorted order of the
+        # values (cached until the cells change)
+        if self._ranked is None or self._ranked[0] is not self.cells:
+            sorted_uniques = {}
+            levels = []
+            for col, uniques in self.uniques().items():
+                ranks, sorted_uniques[col] = pd.factorize(uniques, sort=True)
+                levels.append(ranks[self.cells.index.get_level_values(col)])
+            cells = self.cells.set_axis(pd.MultiIndex.from_arrays(levels, names=self.group_cols))
+            self._ranked = (self.cells, cells, sorted_uniques)
+        return self._ranked[1:]
+
+    def rollup(self, dims, filters=None):
+        """
+        Document sums and row counts grouped by any subset `dims` of `group_cols`,
+        computed from the cells and sorted like a plain groupby. An empty `dims`
+        gives the grand total. `filters` maps a grouping column to the value (or
+        list of values) to keep, e.g. {'TAHUN': 2024}.
+        """
+        dims = list(dims)
+        unknown = [col for col in dims + list(filters or {}) if col not in self.group_cols]
+        if unknown:
+            raise ValueError(f"Unknown grouping column(s) {unknown}; choose from {self.group_cols}")
+
+        cells, sorted_uniques = self._ranked_cells()
+        if filters:
+            keep = np.ones(len(cells), dtype=bool)
+            for col, values in filters.items():
+                values = values if isinstance(values, (list, tuple, set)) else [values]
+                codes = sorted_uniques[col].get_indexer(list(values))
+                keep &= np.isin(cells.index.get_level_values(col), codes[codes >= 0])
+            cells = cells[keep]
+
+        if not dims:
+            return cells.sum().to_frame().T.reset_index(drop=True)
+
+        # Roll up from the cells instead of the raw rows
+        grouped = cells.groupby(level=dims, sort=True).sum().reset_index()
+        for col in dims:
+            grouped[col] = sorted_uniques[col].take(grouped[col].to_numpy())
+        return grouped
+
+    def build_views(self, view_groupings):
+        """Roll the cells up into every view; values are sorted like a plain groupby."""
+        views = {}
+        for name, cols in view_groupings.items():
+            grouped = self.rollup(cols).drop(columns=ROW_COUNT)
+
+            # Optional: Add total document count
+            grouped['TOTAL DOKUMEN'] = grouped[self.doc_columns].sum(axis=1)
+
+            # add a new column 'NO' with sequential numbers starting from 1
+            grouped.insert(0, 'NO', range(1, len(grouped) + 1))
+
+            views[name] = grouped
+
+        return views
@@ -0,0 +1,119 @@
+# ==============================
+# BENCHMARK OF THE EXCEL READER BACKENDS
+# ==============================
+
+# Writes synthetic uploads (same columns as a real export) of 10k, 100k and 1M
+# rows and times every installed reader engine on them, plus the bounded-memory
+# openpyxl stream used by prepare_data.py --stream:
+#
+#   python3 uploads/benchmark_excel_readers.py
+#   python3 uploads/benchmark_excel_readers.py --sizes 10000 100000 --repeat 3 --csv readers.csv
+#
+# Generated workbooks are kept in --workdir and reused by later runs.
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from columns import doc_columns
+from excel_reader import available_engines, read_excel
+from excel_writer import StreamingExcelWriter
+from ingest import iter_excel_chunks
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Rows generated per block while writing a synthetic workbook
+BLOCK_SIZE = 50_000
+
+
+def synthetic_upload(n_rows, seed=0):
+    """Yield blocks of an upload-shaped sheet: NO, NAMA, NIP, the grouping and the document columns."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, BLOCK_SIZE):
+        n = min(BLOCK_SIZE, n_rows - start)
+        block = {
+            "NO": np.arange(start + 1, start + n + 1),
+            "NAMA": [f"Pegawai {i}" for i in range(start, start + n)],
+            "NIP": rng.integers(10**17, 10**18, n).astype(str),
+            "UNIT KERJA": rng.choice([f"Dinas {i}" for i in range(40)], n),
+            "TINGKAT": rng.choice(["SMA", "D3", "S1", "S2", "S3"], n),
+            "LOKASI": rng.choice(["Kab. Ngawi", "Kab. Tuban", "Kab. Malang", "Kota Malang", "Kota Surabaya"], n),
+            "PROVINSI": "Jawa Timur",
+            "STATUS": rng.choice(["PNS", "CPNS", "PPPK"], n),
+            "JENIS KELAMIN": rng.choice(["L", "P"], n),
+        }
+        completeness = rng.random(n)
+        for col in doc_columns:
+            block[col] = np.where(rng.random(n) < completeness, "√", None)
+        block["BULAN"] = rng.choice(["Januari", "Februari", "Maret"], n)
+        block["TAHUN"] = 2024
+        yield pd.DataFrame(block)
+
+
+def make_workbook(file_path, n_rows):
+    if os.path.exists(file_path):
+        return
+    writer = None
+    for block in synthetic_upload(n_rows):
+        if writer is None:
+            writer = StreamingExcelWriter(file_path + ".tmp", block.columns)
+        writer.append(block)
+    writer.close()
+    os.replace(file_path + ".tmp", file_path)
+
+
+def read_streaming(file_path):
+    rows = 0
+    for chunk, _ in iter_excel_chunks(file_path):
+        rows += len(chunk)
+    return rows
+
+
+def readers():
+    """Name -> function(file_path) returning the number of rows read."""
+    found = {engine: (lambda path, engine=engine: len(read_excel(path, engine=engine, index_col=1)))
+             for engine in available_engines()}
+    found["openpyxl --stream"] = read_streaming
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the Excel reader backends on synthetic uploads.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="rows per workbook")
+    parser.add_argument("--repeat", type=int, default=1, help="reads per reader and size (the best is kept)")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "excel_reader_benchmark"),
+                        help="where the synthetic workbooks are written and reused")
+    parser.add_argument("--csv", help="also write the results to this CSV file")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    for n_rows in args.sizes:
+        file_path = os.path.join(args.workdir, f"upload_{n_rows}.xlsx")
+        print(f"Preparing {file_path} ...", flush=True)
+        make_workbook(file_path, n_rows)
+
+        for name, read in readers().items():
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = read(file_path)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            results.append({"rows": n_rows, "reader": name, "seconds": round(best, 3),
+                            "rows_per_second": int(rows / best) if best else None})
+            print(f"  {name:<18} {best:9.3f} s", flush=True)
+
+    results = pd.DataFrame(results)
+    print()
+    print(results.pivot(index="rows", columns="reader", values="seconds").to_string())
+    if args.csv:
+        results.to_csv(args.csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
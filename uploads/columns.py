@@ -0,0 +1,29 @@
+# ==============================
+# SHARED COLUMN DEFINITIONS
+# ==============================
+
+# Document columns (1 = document present, 0 = missing)
+doc_columns = [
+    "FOTO 1/2 BADAN (*)", "FOTO FULL BODY (*)", "AKTA LAHIR (*)", 
+    "KTP (*)", "NPWP(*)", "SUMPAH PNS", "NOTA BKN", "SPMT CPNS", 
+    "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
+]
+
+# Full list of columns to group by (first priority is UNIT KERJA)
+group_cols = ['UNIT KERJA', 'TINGKAT', 'LOKASI', 'PROVINSI', 'STATUS', 'JENIS KELAMIN', 'BULAN', 'TAHUN']
+
+# Grouping columns that hold numbers (read as integers from CSV/TSV exports)
+numeric_group_cols = ['TAHUN']
+
+# Columns that identify one monthly upload (used by prepare_data.py --append)
+period_cols = ['BULAN', 'TAHUN']
+
+# Output file for each aggregated view and the columns it is grouped by
+view_groupings = {
+    "data_view.xlsx": group_cols,
+    "data_view_tingkat.xlsx": ['TINGKAT'],
+    "data_view_lokasi.xlsx": ['LOKASI'],
+    "data_view_provinsi.xlsx": ['PROVINSI'],
+    "data_view_status.xlsx": ['STATUS'],
+    "data_view_jeniskelamin.xlsx": ['JENIS KELAMIN'],
+}
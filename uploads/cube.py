@@ -0,0 +1,74 @@
+# ==============================
+# ROLL-UP QUERIES OVER THE PREPARED CUBE
+# ==============================
+
+# prepare_data.py keeps the document sums and row counts of every distinct
+# combination of the eight grouping columns in data_view_cells.npz. This script
+# answers any other slice from those cells without re-reading the upload, e.g.
+#
+#   python3 uploads/cube.py PROVINSI STATUS
+#   python3 uploads/cube.py TINGKAT TAHUN --where BULAN=Januari --output tingkat_tahun.xlsx
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from aggregation import CellAccumulator
+from view_json import JSON_SUFFIX, write_view_json
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+default_cells_file = os.path.join(script_dir, "data_view_cells.npz")
+
+
+def parse_filters(where, uniques):
+    """Turn COLUMN=VALUE[,VALUE...] arguments into rollup filters, matching each value's type."""
+    filters = {}
+    for item in where:
+        col, sep, text = item.partition("=")
+        col = col.strip().upper()
+        if not sep or col not in uniques:
+            raise ValueError(f"Invalid filter {item!r}; use COLUMN=VALUE with one of {list(uniques)}")
+        # Command-line values are text; match them against the stored values as text
+        by_text = {str(value): value for value in uniques[col]}
+        filters.setdefault(col, []).extend(by_text.get(value.strip(), value.strip()) for value in text.split(","))
+    return filters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll the prepared cells up over any grouping columns.")
+    parser.add_argument("dims", nargs="*", help="grouping columns to keep (none = grand total)")
+    parser.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="keep only these values of a grouping column (repeatable, values comma-separated)")
+    parser.add_argument("--cells", default=default_cells_file, help="cube file written by prepare_data.py")
+    parser.add_argument("--output", help=f"write the result to .xlsx, .csv or {JSON_SUFFIX} instead of printing it")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cells):
+        print(f"Error: File not found at {args.cells}; run prepare_data.py first")
+        sys.exit(1)
+
+    try:
+        cube = CellAccumulator.load(args.cells)
+        filters = parse_filters(args.where, cube.uniques())
+        result = cube.rollup([dim.strip().upper() for dim in args.dims], filters)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    result['TOTAL DOKUMEN'] = result[cube.doc_columns].sum(axis=1)
+
+    if args.output is None:
+        with pd.option_context("display.max_rows", None, "display.width", None):
+            print(result.to_string(index=False))
+    elif args.output.endswith(JSON_SUFFIX):
+        write_view_json(result, args.output)
+    elif args.output.endswith(".csv"):
+        result.to_csv(args.output, index=False)
+    else:
+        result.to_excel(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+# ==============================
+# BINARY COLUMNAR SNAPSHOT OF data_ready
+# ==============================
+
+# prepare_data.py writes data_ready.xlsx for download and, next to it, a typed
+# NumPy snapshot (data_ready.npz) that the training scripts load instead of
+# parsing the workbook. Numeric columns are stored in their smallest integer or
+# float dtype; text columns are stored as int32 codes plus a JSON dictionary of
+# their values. The 0/1 document columns are bit-packed into a single uint16
+# "doc_mask" array (see doc_mask.py) instead of one array per document.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from doc_mask import MAX_MASK_BITS, is_binary, pack_doc_mask, unpack_doc_mask
+from excel_reader import read_excel
+from snapshot_meta import SNAPSHOT_VERSION, file_stamp, read_npz_meta, read_snapshot_meta, save_npz, snapshot_path_for
+
+
+def to_json_value(value):
+    """Convert a cell value to something json.dumps accepts (NumPy scalars -> Python, others -> str)."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _excel_dtype(values):
+    """Reproduce the dtype read_excel gives back: integers and integral floats come back as int64."""
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    if values.dtype.kind == "f" and not np.isnan(values).any() and (values == np.floor(values)).all():
+        return values.astype(np.int64)
+    return values
+
+
+def _compact(values):
+    """Store integers in the smallest dtype that holds them; the original dtype is restored on load."""
+    if values.dtype.kind in "iu" and len(values):
+        return pd.to_numeric(pd.Series(values), downcast="integer").to_numpy()
+    return values
+
+
+class SnapshotBuilder:
+    """
+    Collect data_ready column by column, one chunk of rows at a time.
+
+    Numeric columns are kept as typed arrays and text columns as int32 codes
+    into a running value dictionary, so no object-dtype frame of the whole
+    dataset is ever held in memory. `mask_columns` (the document columns) are
+    packed into one uint16 per row for as long as every value is 0 or 1.
+    """
+
+    def __init__(self, mask_columns=None):
+        self.columns = []
+        self.parts = {}
+        self.encoders = {}
+        self.mask_columns = list(mask_columns or [])[:MAX_MASK_BITS]
+        self.mask_parts = []
+        self.packed = bool(self.mask_columns)
+        self.data_sha256 = None
+
+    @classmethod
+    def from_snapshot(cls, snapshot_file):
+        """Start from the rows of an existing snapshot (append mode), without touching any xlsx."""
+        builder = cls()
+        with np.load(snapshot_file, allow_pickle=False) as data:
+            meta = read_npz_meta(data)
+            mask_columns = sorted((c for c in meta["columns"] if c["kind"] == "mask"), key=lambda c: c["bit"])
+            builder.mask_columns = [column["name"] for column in mask_columns]
+            builder.packed = bool(mask_columns)
+            if mask_columns:
+                builder.mask_parts = [data["doc_mask"]]
+            for i, column in enumerate(meta["columns"]):
+                col = column["name"]
+                builder.columns.append(col)
+                if column["kind"] == "mask":
+                    builder.parts[col] = []
+                    continue
+                values = data[f"col_{i}"]
+                if column["kind"] == "categorical":
+                    builder.encoders[col] = {value: code for code, value in enumerate(column["categories"])}
+                elif "dtype" in column:
+                    values = values.astype(column["dtype"])
+                builder.parts[col] = [values]
+        return builder
+
+    def _column_values(self, col):
+        values = np.concatenate(self.parts[col])
+        if col in self.encoders:
+            categories = np.array(list(self.encoders[col]) + [np.nan], dtype=object)
+            return categories[values]
+        return values
+
+    def drop_periods(self, period_cols, periods):
+        """Remove every collected row whose `period_cols` values are one of `periods`."""
+        if not self.columns or not periods:
+            return
+        keys = pd.MultiIndex.from_arrays([self._column_values(col) for col in period_cols])
+        keep = ~keys.isin(list(periods))
+        for col in self.columns:
+            if self.packed and col in self.mask_columns:
+                continue
+            self.parts[col] = [np.concatenate(self.parts[col])[keep]]
+        if self.packed:
+            self.mask_parts = [np.concatenate(self.mask_parts)[keep]]
+
+    def _encode(self, col, series):
+        encoder = self.encoders[col]
+        codes, uniques = pd.factorize(series)
+        lookup = np.array([encoder.setdefault(to_json_value(v), len(encoder)) for v in uniques], dtype=np.int32)
+        return lookup[codes] if len(uniques) else codes.astype(np.int32)
+
+    def _make_categorical(self, col):
+        # A column that was numeric so far turned out to hold text: re-encode what we have
+        self.encoders[col] = {}
+        self.parts[col] = [self._encode(col, pd.Series(part)) for part in self.parts[col]]
+
+    def _unpack_masks(self):
+        # A document column turned out to hold something other than 0/1: go back
+        # to one plain int64 array per document column
+        if self.mask_parts:
+            flags = unpack_doc_mask(np.concatenate(self.mask_parts), len(self.mask_columns))
+            for bit, col in enumerate(self.mask_columns):
+                self.parts[col] = [flags[:, bit].astype(np.int64)]
+        self.mask_parts = []
+        self.packed = False
+
+    def append(self, df):
+        if self.columns and list(df.columns) != self.columns:
+            raise ValueError(f"Columns {list(df.columns)} do not match the existing data {self.columns}")
+
+        if self.packed:
+            if not all(col in df.columns for col in self.mask_columns):
+                self._unpack_masks()
+            else:
+                doc_values = df[self.mask_columns]
+                if all(dtype.kind in "iuf" for dtype in doc_values.dtypes) and is_binary(doc_values):
+                    self.mask_parts.append(pack_doc_mask(doc_values))
+                else:
+                    self._unpack_masks()
+
+        for col in df.columns:
+            series = df[col]
+            if col not in self.parts:
+                self.columns.append(col)
+                self.parts[col] = []
+                if series.dtype.kind not in "biuf":
+                    self.encoders[col] = {}
+            if self.packed and col in self.mask_columns:
+                continue
+            elif col not in self.encoders and series.dtype.kind not in "biuf":
+                self._make_categorical(col)
+
+            if col in self.encoders:
+                self.parts[col].append(self._encode(col, series))
+            else:
+                self.parts[col].append(series.to_numpy())
+
+    def write(self, snapshot_file, source_file):
+        """
+        Save the collected rows as a .npz snapshot tied to the current version of
+        `source_file`, or as a standalone snapshot when `source_file` is None.
+        """
+        arrays = {}
+        columns = []
+        if self.packed:
+            arrays["doc_mask"] = np.concatenate(self.mask_parts)
+        for i, col in enumerate(self.columns):
+            if self.packed and col in self.mask_columns:
+                # read_excel gives 0/1 columns back as int64
+                columns.append({"name": col, "kind": "mask", "bit": self.mask_columns.index(col),
+                                "dtype": np.dtype(np.int64).str})
+                continue
+            values = np.concatenate(self.parts[col])
+            key = f"col_{i}"
+            if col in self.encoders:
+                arrays[key] = values
+                columns.append({"name": col, "kind": "categorical", "categories": list(self.encoders[col])})
+            else:
+                values = _excel_dtype(values)
+                arrays[key] = _compact(values)
+                columns.append({"name": col, "kind": "numeric", "dtype": values.dtype.str})
+
+        # Fingerprint of the normalized data itself (independent of file times), so
+        # unchanged data can be recognized even when the workbook bytes differ
+        digest = hashlib.sha256(json.dumps(columns).encode("utf-8"))
+        for key in sorted(arrays):
+            digest.update(np.ascontiguousarray(arrays[key]).tobytes())
+        self.data_sha256 = digest.hexdigest()
+
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "columns": columns,
+            "data_sha256": self.data_sha256,
+            # None marks a standalone snapshot (append mode) that no xlsx backs
+            "source": file_stamp(source_file) if source_file is not None else None,
+        }
+        save_npz(snapshot_file, arrays, meta)
+
+
+def load_snapshot(snapshot_file, source_file, columns=None, compact=False):
+    """
+    Load the snapshot as a DataFrame (only `columns`, when given), or return None
+    when it is missing or stale.
+
+    With `compact`, text columns come back as categoricals (sorted categories),
+    document flags as int8 and numbers in their stored (smallest) dtype instead
+    of the object/int64 columns read_excel would give.
+    """
+    meta = read_snapshot_meta(snapshot_file, source_file)
+    if meta is None:
+        return None
+
+    with np.load(snapshot_file, allow_pickle=False) as data:
+        frame = {}
+        for i, column in enumerate(meta["columns"]):
+            if columns is not None and column["name"] not in columns:
+                continue
+            if column["kind"] == "mask":
+                dtype = np.int8 if compact else column["dtype"]
+                frame[column["name"]] = ((data["doc_mask"] >> column["bit"]) & 1).astype(dtype)
+                continue
+            values = data[f"col_{i}"]
+            if compact and column["kind"] == "categorical":
+                # Code -1 (missing) is NaN for from_codes as well
+                values = pd.Categorical.from_codes(values, column["categories"]).remove_unused_categories()
+                # Sorted like groupby sorts the object column (numbers before text when a
+                # blank cell became 0 next to names), so groupby results keep their order
+                values = values.reorder_categories(pd.factorize(values.categories, sort=True)[1])
+            elif compact:
+                pass
+            elif column["kind"] == "categorical":
+                categories = np.array(column["categories"] + [np.nan], dtype=object)
+                # Code -1 (missing) picks the trailing NaN
+                values = categories[values]
+            elif "dtype" in column:
+                values = values.astype(column["dtype"])
+            frame[column["name"]] = values
+
+    return pd.DataFrame(frame)
+
+
+def load_doc_mask(file_path):
+    """
+    The packed document mask of data_ready (one uint16 per row, bit i = i-th
+    document column), or None when the snapshot is stale or stores plain columns.
+    """
+    snapshot_file = snapshot_path_for(file_path)
+    if read_snapshot_meta(snapshot_file, file_path) is None:
+        return None
+    with np.load(snapshot_file, allow_pickle=False) as data:
+        return data["doc_mask"] if "doc_mask" in data.files else None
+
+
+def compact_frame(df):
+    """Text columns -> categoricals, 0/1 integer columns -> int8 (in place, returns df)."""
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("category")
+        elif df[col].dtype.kind in "iu" and is_binary(df[col].to_numpy()):
+            df[col] = df[col].astype(np.int8)
+    return df
+
+
+def load_data_ready(file_path, compact=False):
+    """
+    Load data_ready with its first column as the index.
+
+    Uses the .npz snapshot when it matches the Excel file (or is standalone,
+    after an append) and falls back to reading the workbook (excel_reader) when
+    it is missing or stale. `compact` gives the categorical/int8 columns of
+    load_snapshot, which the trainers use to keep their working set small.
+    """
+    df = load_snapshot(snapshot_path_for(file_path), file_path, compact=compact)
+    if df is None:
+        df = read_excel(file_path, index_col=0)
+        return compact_frame(df) if compact else df
+    return df.set_index(df.columns[0])
@@ -0,0 +1,76 @@
+# ==============================
+# PACKED DOCUMENT MASK
+# ==============================
+
+# The document columns are 0/1 flags, so one row's flags fit in the bits of a
+# single uint16 (bit i = doc_columns[i]). Completeness is then a popcount of the
+# mask and per-document tallies are bit tests over the distinct mask values.
+
+import numpy as np
+
+MASK_DTYPE = np.uint16
+MAX_MASK_BITS = 16
+
+# Number of set bits for every possible uint16 value
+_POPCOUNT_TABLE = np.zeros(1 << MAX_MASK_BITS, dtype=np.uint8)
+for _bit in range(MAX_MASK_BITS):
+    _POPCOUNT_TABLE += ((np.arange(1 << MAX_MASK_BITS) >> _bit) & 1).astype(np.uint8)
+
+
+def is_binary(values):
+    """True when every value is 0 or 1 (the only values a mask can represent)."""
+    values = np.asarray(values)
+    return bool(((values == 0) | (values == 1)).all())
+
+
+def pack_doc_mask(doc_values):
+    """Pack an (n_rows, n_docs) 0/1 matrix into one uint16 per row."""
+    doc_values = np.asarray(doc_values)
+    if doc_values.shape[1] > MAX_MASK_BITS:
+        raise ValueError(f"At most {MAX_MASK_BITS} document columns fit in a mask")
+    doc_mask = np.zeros(len(doc_values), dtype=MASK_DTYPE)
+    for bit in range(doc_values.shape[1]):
+        doc_mask |= (doc_values[:, bit] != 0).astype(MASK_DTYPE) << MASK_DTYPE(bit)
+    return doc_mask
+
+
+def unpack_doc_mask(doc_mask, n_docs):
+    """Expand the masks back into an (n_rows, n_docs) uint8 matrix of 0/1 flags."""
+    return ((np.asarray(doc_mask)[:, None] >> np.arange(n_docs)) & 1).astype(np.uint8)
+
+
+def popcount(doc_mask):
+    """Number of documents present in each row."""
+    return _POPCOUNT_TABLE[np.asarray(doc_mask, dtype=MASK_DTYPE)]
+
+
+def doc_counts(doc_mask, n_docs, groups=None, n_groups=1):
+    """
+    How many rows have each document, computed from the histogram of mask values.
+
+    With `groups` (one code 0..n_groups-1 per row) the result has one row of
+    counts per group, from a single bincount over (group, mask) pairs.
+    """
+    n_masks = 1 << n_docs
+    keys = np.asarray(doc_mask, dtype=np.int64)
+    if groups is not None:
+        keys = keys + np.asarray(groups, dtype=np.int64) * n_masks
+    histogram = np.bincount(keys, minlength=n_groups * n_masks).reshape(-1, n_masks)
+    present = unpack_doc_mask(np.arange(n_masks), n_docs).astype(np.int64)
+    counts = histogram @ present
+    return counts if groups is not None else counts[0]
+
+
+def present_counts(df, doc_columns, doc_mask=None):
+    """
+    Documents present per row, as used for Completeness_Percentage.
+
+    Uses the popcount of `doc_mask` (or of a mask packed from `df`) and only falls
+    back to a row-wise sum when the document columns hold values other than 0/1.
+    """
+    if doc_mask is not None and len(doc_mask) == len(df):
+        return popcount(doc_mask)
+    doc_values = df[doc_columns].to_numpy()
+    if len(doc_columns) <= MAX_MASK_BITS and is_binary(doc_values):
+        return popcount(pack_doc_mask(doc_values))
+    return df[doc_columns].sum(axis=1).to_numpy()
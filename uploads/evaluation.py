@@ -0,0 +1,162 @@
+# ==============================
+# CLUSTER METRICS ON DOCUMENT PATTERNS
+# ==============================
+
+# Silhouette, Calinski-Harabasz and Davies-Bouldin of a clustering of the rows,
+# computed from the distinct (pattern, label) pairs and how many rows share
+# each. Rows with the same pair have the same features and the same cluster, so
+# every sum over rows is a sum over those units weighted by their counts: the
+# silhouette's pairwise distances are taken between units only and no step
+# grows with the number of rows.
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from sklearn.metrics import pairwise_distances, silhouette_score
+from sklearn.preprocessing import LabelEncoder
+
+from minibatch import STREAM_BATCH_ROWS, row_batches
+
+# Units per block of the silhouette's distance matrix (block x units floats)
+DISTANCE_BLOCK_ROWS = 1024
+
+# Rows the silhouette of a streamed (mini-batch) fit is estimated from
+SILHOUETTE_SAMPLE_ROWS = 10_000
+
+
+def check_number_of_labels(n_labels, n_samples):
+    """The ValueError sklearn's cluster metrics raise unless 1 < n_labels < n_samples."""
+    if not 1 < n_labels < n_samples:
+        raise ValueError("Number of labels is %d. Valid values are 2 to n_samples - 1 (inclusive)" % n_labels)
+
+
+def pattern_units(patterns, labels):
+    """
+    Collapse the rows of a pattern histogram and their labels to weighted units.
+
+    Returns (X_units, unit_labels, unit_counts, n_labels): one row per distinct
+    (pattern, label) pair, its label encoded 0..n_labels-1 and the number of
+    rows with that pair.
+    """
+    X_patterns, _, inverse = patterns
+    codes = LabelEncoder().fit_transform(np.asarray(labels))
+    n_labels = int(codes.max()) + 1 if len(codes) else 0
+    units, unit_counts = np.unique(inverse.astype(np.int64) * n_labels + codes, return_counts=True)
+    return X_patterns[units // n_labels], units % n_labels, unit_counts, n_labels
+
+
+def weighted_silhouette_score(X, labels, counts, n_labels):
+    """silhouette_score of the rows, each unit of X standing for `counts` identical rows."""
+    check_number_of_labels(n_labels, counts.sum())
+    label_freqs = np.bincount(labels, weights=counts, minlength=n_labels)
+    # Row counts per (unit, cluster): distance sums to a cluster become one product
+    cluster_weights = np.zeros((len(X), n_labels))
+    cluster_weights[np.arange(len(X)), labels] = counts
+
+    scores = np.empty(len(X))
+    for start in range(0, len(X), DISTANCE_BLOCK_ROWS):
+        block = slice(start, start + DISTANCE_BLOCK_ROWS)
+        cluster_distances = cdist(X[block], X) @ cluster_weights
+        own = (np.arange(len(cluster_distances)), labels[block])
+        intra = cluster_distances[own]
+        cluster_distances[own] = np.inf
+        inter = (cluster_distances / label_freqs).min(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            intra = intra / (label_freqs[labels[block]] - 1)
+            scores[block] = (inter - intra) / np.maximum(intra, inter)
+    # nan values are for clusters of size 1, and should be 0
+    return np.average(np.nan_to_num(scores), weights=counts)
+
+
+def weighted_calinski_harabasz_score(X, labels, counts, n_labels):
+    """calinski_harabasz_score of the rows, each unit of X standing for `counts` identical rows."""
+    n_samples = counts.sum()
+    check_number_of_labels(n_labels, n_samples)
+    extra_disp, intra_disp = 0.0, 0.0
+    mean = np.average(X, axis=0, weights=counts)
+    for k in range(n_labels):
+        cluster_k, counts_k = X[labels == k], counts[labels == k]
+        mean_k = np.average(cluster_k, axis=0, weights=counts_k)
+        extra_disp += counts_k.sum() * np.sum((mean_k - mean) ** 2)
+        intra_disp += np.sum(counts_k[:, np.newaxis] * (cluster_k - mean_k) ** 2)
+    return (1.0 if intra_disp == 0.0
+            else extra_disp * (n_samples - n_labels) / (intra_disp * (n_labels - 1.0)))
+
+
+def weighted_davies_bouldin_score(X, labels, counts, n_labels):
+    """davies_bouldin_score of the rows, each unit of X standing for `counts` identical rows."""
+    check_number_of_labels(n_labels, counts.sum())
+    intra_dists = np.zeros(n_labels)
+    centroids = np.zeros((n_labels, X.shape[1]))
+    for k in range(n_labels):
+        cluster_k, counts_k = X[labels == k], counts[labels == k]
+        centroids[k] = np.average(cluster_k, axis=0, weights=counts_k)
+        intra_dists[k] = np.average(cdist(cluster_k, centroids[k:k + 1]).ravel(), weights=counts_k)
+
+    centroid_distances = pairwise_distances(centroids)
+    if np.allclose(intra_dists, 0) or np.allclose(centroid_distances, 0):
+        return 0.0
+
+    centroid_distances[centroid_distances == 0] = np.inf
+    combined_intra_dists = intra_dists[:, None] + intra_dists
+    return np.mean(np.max(combined_intra_dists / centroid_distances, axis=1))
+
+
+def pattern_scores(patterns, labels):
+    """(silhouette, Calinski-Harabasz, Davies-Bouldin) of the row labels of a pattern histogram."""
+    units = pattern_units(patterns, labels)
+    return (weighted_silhouette_score(*units),
+            weighted_calinski_harabasz_score(*units),
+            weighted_davies_bouldin_score(*units))
+
+
+def streamed_scores(X_scaled, labels, batch_rows=STREAM_BATCH_ROWS, sample_rows=SILHOUETTE_SAMPLE_ROWS,
+                    random_state=42):
+    """
+    (silhouette, Calinski-Harabasz, Davies-Bouldin) of row labels, reading X_scaled in batches.
+
+    For fits that never collapse the rows to patterns (the mini-batch mode).
+    CH and DB are exact, from per-cluster sums gathered over two passes of the
+    batches; the silhouette is that of a random sample of `sample_rows` rows
+    (all rows when there are fewer), since it compares every pair.
+    """
+    codes = LabelEncoder().fit_transform(np.asarray(labels))
+    n_samples, n_labels = len(codes), int(codes.max()) + 1
+    check_number_of_labels(n_labels, n_samples)
+    batches = row_batches(n_samples, batch_rows)
+
+    # First pass: cluster sizes and centroids
+    sizes = np.bincount(codes, minlength=n_labels)
+    sums = np.zeros((n_labels, X_scaled.shape[1]))
+    for batch in batches:
+        np.add.at(sums, codes[batch], np.asarray(X_scaled[batch]))
+    centroids = sums / sizes[:, np.newaxis]
+    mean = sums.sum(axis=0) / n_samples
+
+    # Second pass: squared and plain distances of every row to its centroid
+    intra_disp = 0.0
+    centroid_dist_sums = np.zeros(n_labels)
+    for batch in batches:
+        offsets = np.asarray(X_scaled[batch]) - centroids[codes[batch]]
+        squared = np.einsum("ij,ij->i", offsets, offsets)
+        intra_disp += squared.sum()
+        centroid_dist_sums += np.bincount(codes[batch], weights=np.sqrt(squared), minlength=n_labels)
+
+    extra_disp = np.sum(sizes * np.sum((centroids - mean) ** 2, axis=1))
+    calinski_harabasz = (1.0 if intra_disp == 0.0
+                         else extra_disp * (n_samples - n_labels) / (intra_disp * (n_labels - 1.0)))
+
+    intra_dists = centroid_dist_sums / sizes
+    centroid_distances = pairwise_distances(centroids)
+    if np.allclose(intra_dists, 0) or np.allclose(centroid_distances, 0):
+        davies_bouldin = 0.0
+    else:
+        centroid_distances[centroid_distances == 0] = np.inf
+        combined_intra_dists = intra_dists[:, None] + intra_dists
+        davies_bouldin = np.mean(np.max(combined_intra_dists / centroid_distances, axis=1))
+
+    # Sorted sample indices, so the memory map is read front to back
+    sample = np.arange(n_samples)
+    if n_samples > sample_rows:
+        sample = np.sort(np.random.default_rng(random_state).choice(n_samples, sample_rows, replace=False))
+    silhouette = silhouette_score(np.asarray(X_scaled[sample]), codes[sample])
+    return silhouette, calinski_harabasz, davies_bouldin
@@ -0,0 +1,57 @@
+# ==============================
+# PLUGGABLE EXCEL READER
+# ==============================
+
+# Every full-workbook read in the pipeline (the upload in prepare_data.py, the
+# --inputs workbooks and the data_ready.xlsx fallback of the trainers) goes
+# through read_excel below. The engine is picked once:
+#
+#   EXCEL_READER=calamine   Rust-based reader (pip install python-calamine)
+#   EXCEL_READER=openpyxl   pandas' default engine
+#   EXCEL_READER=auto       calamine when it is installed, otherwise openpyxl (default)
+#
+# A failing calamine read is retried with openpyxl, so a missing or broken fast
+# backend never breaks an upload. benchmark_excel_readers.py compares them.
+
+import importlib.util
+import os
+
+import pandas as pd
+
+EXCEL_READER_ENV = "EXCEL_READER"
+FALLBACK_ENGINE = "openpyxl"
+
+# Engine name -> module that has to be importable for it
+ENGINE_MODULES = {
+    "calamine": "python_calamine",
+    "openpyxl": "openpyxl",
+}
+
+
+def available_engines():
+    """Engines whose backing module is installed, fastest first."""
+    return [engine for engine, module in ENGINE_MODULES.items() if importlib.util.find_spec(module) is not None]
+
+
+def pick_engine(preferred=None):
+    """Resolve `preferred` (or $EXCEL_READER, default "auto") to an installed engine."""
+    preferred = (preferred or os.environ.get(EXCEL_READER_ENV) or "auto").lower()
+    engines = available_engines()
+    if preferred in engines:
+        return preferred
+    if preferred not in ("auto", *ENGINE_MODULES):
+        raise ValueError(f"Unknown Excel reader {preferred!r}; choose from auto, {', '.join(ENGINE_MODULES)}")
+    return engines[0] if engines else FALLBACK_ENGINE
+
+
+def read_excel(file_path, engine=None, **kwargs):
+    """pd.read_excel with the selected engine, falling back to openpyxl if it fails."""
+    engine = pick_engine(engine)
+    try:
+        return pd.read_excel(file_path, engine=engine, **kwargs)
+    except (FileNotFoundError, PermissionError):
+        raise
+    except Exception:
+        if engine == FALLBACK_ENGINE:
+            raise
+        return pd.read_excel(file_path, engine=FALLBACK_ENGINE, **kwargs)
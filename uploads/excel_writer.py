@@ -0,0 +1,84 @@
+# ==============================
+# STREAMING EXCEL WRITER
+# ==============================
+
+# Every workbook prepare_data.py produces (data_ready.xlsx and the data_view*
+# tables) is written through openpyxl's write_only mode: rows go straight to
+# the sheet XML instead of building the whole workbook in memory the way
+# DataFrame.to_excel does. write_outputs() writes several of them at once in a
+# process pool.
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import openpyxl
+
+from view_json import write_view_json
+
+# Rows handed to the sheet per block when writing a whole DataFrame
+WRITE_BLOCK_ROWS = 50_000
+
+
+class StreamingExcelWriter:
+    """Write a single-sheet workbook chunk by chunk using openpyxl's write_only mode."""
+
+    def __init__(self, file_path, columns):
+        self.file_path = file_path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(list(columns))
+
+    def append(self, df):
+        for row in df.itertuples(index=False, name=None):
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.file_path)
+        self.workbook.close()
+
+
+def write_frame(df, file_path):
+    """Write `df` (without its index) as a single-sheet workbook, replacing `file_path` atomically."""
+    tmp_file = file_path + ".tmp"
+    writer = StreamingExcelWriter(tmp_file, df.columns)
+    for start in range(0, len(df), WRITE_BLOCK_ROWS):
+        writer.append(df.iloc[start:start + WRITE_BLOCK_ROWS])
+    writer.close()
+    os.replace(tmp_file, file_path)
+
+
+# (df, xlsx path, json.gz path or None) of the running write_outputs() call; the
+# forked workers inherit it instead of receiving pickled copies of the frames
+_jobs = []
+
+
+def _write_job(index):
+    df, file_path, json_file = _jobs[index]
+    start = time.perf_counter()
+    write_frame(df, file_path)
+    if json_file is not None:
+        write_view_json(df, json_file)
+    return file_path, time.perf_counter() - start
+
+
+def write_outputs(jobs, workers=None):
+    """
+    Write every (df, xlsx path, json.gz path or None) job, in a process pool when
+    more than one worker is available; returns (file path, seconds) per job.
+
+    Uses fork like ingest.iter_workbook_parts; without it the files are written
+    one by one.
+    """
+    global _jobs
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    # Largest tables first so the long write does not start last
+    _jobs = sorted(jobs, key=lambda job: -job[0].size)
+    try:
+        if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            return [_write_job(index) for index in range(len(_jobs))]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            return list(pool.map(_write_job, range(len(_jobs))))
+    finally:
+        _jobs = []
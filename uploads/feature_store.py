@@ -0,0 +1,189 @@
+# ==============================
+# SHARED FEATURE STORE
+# ==============================
+
+# Every trainer clusters the same matrix: the document columns plus
+# Weighted_Completeness, standardized with a StandardScaler. The store builds it
+# once per version of data_ready (the snapshot's data_sha256) and keeps
+#
+#   feature_store/X_scaled.npy     the scaled matrix, opened memory-mapped read-only
+#   feature_store/scaler.pkl       the fitted scaler, to transform new rows for the saved models
+#   feature_store/meta.json        data version, feature columns and shape of the matrix
+#   feature_store/X_pca.npy        2-D PCA projection of X_scaled for the scatter plots
+#   feature_store/pca.pkl          the fitted PCA, to project each model's centroids
+#   feature_store/projection.json  the feature version the projection belongs to
+#
+# so only the first trainer after an upload fits the scaler and the PCA; the
+# other tabs attach to the stored matrices and only overlay their own labels.
+# The scaler is fitted and the matrix written batch by batch, straight into the
+# memory-mapped file, so building the store never holds a second full copy.
+
+import json
+import os
+
+import joblib
+import numpy as np
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+from snapshot_meta import snapshot_data_hash
+from fingerprint import file_sha256, run_key
+from minibatch import STREAM_BATCH_ROWS, row_batches
+
+FEATURE_VERSION = 1
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feature_store")
+MATRIX_FILE = "X_scaled.npy"
+SCALER_FILE = "scaler.pkl"
+META_FILE = "meta.json"
+PROJECTION_FILE = "X_pca.npy"
+PCA_FILE = "pca.pkl"
+PROJECTION_META_FILE = "projection.json"
+
+# From this many rows on the projection is fitted with IncrementalPCA over
+# batches of the memory-mapped matrix, so PCA never holds a centered copy of
+# the whole matrix in memory
+LARGE_PROJECTION_ROWS = 200_000
+PROJECTION_BATCH_ROWS = 50_000
+
+
+def data_version(data_file):
+    """Version of the data behind data_ready: the snapshot's data hash, else the workbook's SHA-256."""
+    data_sha256 = snapshot_data_hash(data_file)
+    if data_sha256 is None and os.path.exists(data_file):
+        data_sha256 = file_sha256(data_file)
+    return data_sha256
+
+
+def _read_meta(store_dir, meta_file=META_FILE):
+    try:
+        with open(os.path.join(store_dir, meta_file), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _tmp_path(store_dir, name):
+    return os.path.join(store_dir, f"{name}.{os.getpid()}.tmp")
+
+
+def _write_store(store_dir, arrays, objects, meta_file, meta, written=()):
+    os.makedirs(store_dir, exist_ok=True)
+    # Per-process temporary files + os.replace, so trainers started together and
+    # readers never see a half-written file; the meta record goes last since it
+    # is what marks the stored files as valid. `written` names files the caller
+    # already wrote to their temporary path
+    def tmp(name):
+        return _tmp_path(store_dir, name)
+
+    for name, values in arrays.items():
+        with open(tmp(name), "wb") as f:
+            np.save(f, values)
+    for name, value in objects.items():
+        joblib.dump(value, tmp(name))
+    with open(tmp(meta_file), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    for name in [*written, *arrays, *objects, meta_file]:
+        os.replace(tmp(name), os.path.join(store_dir, name))
+
+
+def load_scaler(store_dir=STORE_DIR):
+    """The StandardScaler fitted on the current data (None before the first training run)."""
+    scaler_file = os.path.join(store_dir, SCALER_FILE)
+    return joblib.load(scaler_file) if os.path.exists(scaler_file) else None
+
+
+def fit_scaled(features, out, batch_rows=STREAM_BATCH_ROWS):
+    """
+    Fit a StandardScaler on `features` and write the scaled rows into `out`,
+    both batch by batch; returns the scaler.
+    """
+    scaler = StandardScaler()
+    batches = row_batches(len(features), batch_rows)
+    for batch in batches:
+        scaler.partial_fit(features.iloc[batch])
+    for batch in batches:
+        out[batch] = scaler.transform(features.iloc[batch])
+    return scaler
+
+
+def load_features(data_file, features, store_dir=STORE_DIR):
+    """
+    Return (X_scaled, scaler) for the unscaled `features` frame of `data_file`.
+
+    X_scaled is a read-only memory map of the stored matrix when the store
+    matches this data version and these columns; otherwise the scaler is fitted,
+    both are stored and the fresh matrix is mapped.
+    """
+    columns = [str(col) for col in features.columns]
+    version = data_version(data_file)
+    key = run_key(FEATURE_VERSION, version, *columns) if version is not None else None
+
+    meta = _read_meta(store_dir)
+    if key is not None and meta is not None and meta.get("key") == key and meta.get("rows") == len(features):
+        try:
+            return (np.load(os.path.join(store_dir, MATRIX_FILE), mmap_mode="r"),
+                    joblib.load(os.path.join(store_dir, SCALER_FILE)))
+        except (OSError, ValueError, EOFError):
+            pass  # damaged store: rebuild below
+
+    shape = (len(features), len(columns))
+    if key is None:
+        # Nothing identifies this data, so there is nothing to reuse it for
+        X_scaled = np.empty(shape)
+        return X_scaled, fit_scaled(features, X_scaled)
+
+    os.makedirs(store_dir, exist_ok=True)
+    X_scaled = np.lib.format.open_memmap(_tmp_path(store_dir, MATRIX_FILE), mode="w+", dtype=np.float64, shape=shape)
+    scaler = fit_scaled(features, X_scaled)
+    X_scaled.flush()
+    del X_scaled
+    _write_store(store_dir, {}, {SCALER_FILE: scaler}, META_FILE,
+                 {"key": key, "data_sha256": version, "columns": columns,
+                  "rows": len(features), "shape": list(shape)}, written=[MATRIX_FILE])
+    return np.load(os.path.join(store_dir, MATRIX_FILE), mmap_mode="r"), scaler
+
+
+def fit_projection(X_scaled, n_components=2):
+    """Fit a PCA on X_scaled and return (X_pca, pca); large matrices are processed in batches."""
+    n_rows = len(X_scaled)
+    if n_rows < LARGE_PROJECTION_ROWS:
+        pca = PCA(n_components=n_components)
+        return pca.fit_transform(X_scaled), pca
+
+    pca = IncrementalPCA(n_components=n_components, batch_size=PROJECTION_BATCH_ROWS)
+    batches = [slice(start, start + PROJECTION_BATCH_ROWS) for start in range(0, n_rows, PROJECTION_BATCH_ROWS)]
+    for batch in batches:
+        pca.partial_fit(X_scaled[batch])
+    X_pca = np.empty((n_rows, n_components))
+    for batch in batches:
+        X_pca[batch] = pca.transform(X_scaled[batch])
+    return X_pca, pca
+
+
+def load_projection(X_scaled, store_dir=STORE_DIR):
+    """
+    Return (X_pca, pca), the 2-D PCA projection of X_scaled (from load_features).
+
+    Fitted once per stored feature matrix and then memory-mapped like it; an
+    X_scaled that is not the stored matrix is projected in memory.
+    """
+    matrix_file = os.path.join(store_dir, MATRIX_FILE)
+    meta = _read_meta(store_dir)
+    stored = (isinstance(X_scaled, np.memmap) and meta is not None and os.path.exists(matrix_file)
+              and os.path.samefile(X_scaled.filename, matrix_file))
+    if not stored:
+        return fit_projection(X_scaled)
+
+    projection = _read_meta(store_dir, PROJECTION_META_FILE)
+    if projection is not None and projection.get("key") == meta.get("key"):
+        try:
+            return (np.load(os.path.join(store_dir, PROJECTION_FILE), mmap_mode="r"),
+                    joblib.load(os.path.join(store_dir, PCA_FILE)))
+        except (OSError, ValueError, EOFError):
+            pass  # damaged store: refit below
+
+    X_pca, pca = fit_projection(X_scaled)
+    _write_store(store_dir, {PROJECTION_FILE: X_pca}, {PCA_FILE: pca}, PROJECTION_META_FILE,
+                 {"key": meta.get("key"), "solver": type(pca).__name__, "shape": list(X_pca.shape)})
+    return np.load(os.path.join(store_dir, PROJECTION_FILE), mmap_mode="r"), pca
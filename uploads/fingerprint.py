@@ -0,0 +1,90 @@
+# ==============================
+# CONTENT FINGERPRINTS FOR SKIPPING UNCHANGED RUNS
+# ==============================
+
+# Each stage (prepare_data.py and every training script) records a key built from
+# the hashes of its inputs in a small JSON file next to its outputs. When the next
+# run computes the same key and all outputs still exist, the stage is skipped and
+# the existing results are reused. The key includes code_version(), so editing the
+# script or any pipeline module it imports also forces a rerun. This module only
+# uses the standard library, so a stage can run the check before its heavy imports.
+
+import ast
+import datetime
+import hashlib
+import json
+import os
+
+
+def file_sha256(path, block_size=1 << 20):
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_key(*parts):
+    """Combine input hashes/settings into one key; None if any part is unknown."""
+    if any(part is None for part in parts):
+        return None
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _local_imports(path, root):
+    """The uploads/*.py modules a source file imports (anywhere in it), found by parsing it."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split(".")[0])
+    paths = (os.path.join(root, f"{name}.py") for name in names)
+    return [path for path in paths if os.path.exists(path)]
+
+
+def code_version(script_file):
+    """
+    Hash of a stage's own source: `script_file` and every module under uploads/
+    it imports, directly or through another module.
+
+    The imports are read from the files rather than executed, so the check can
+    run before a script loads its dependencies.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    pending, seen = [os.path.abspath(script_file)], set()
+    while pending:
+        path = pending.pop()
+        if path not in seen:
+            seen.add(path)
+            pending.extend(_local_imports(path, root))
+    return run_key(*(f"{os.path.relpath(path, root)}:{file_sha256(path)}" for path in sorted(seen)))
+
+
+def is_up_to_date(fingerprint_file, key, outputs):
+    """True when the last recorded run had the same key and all of its outputs still exist."""
+    if key is None or not os.path.exists(fingerprint_file):
+        return False
+    try:
+        with open(fingerprint_file, encoding="utf-8") as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return recorded.get("key") == key and all(os.path.exists(path) for path in outputs)
+
+
+def record_run(fingerprint_file, key, outputs, **details):
+    """Store the key of a finished run together with the outputs it produced."""
+    if key is None:
+        return
+    recorded = {
+        "key": key,
+        "outputs": [os.path.basename(path) for path in outputs],
+        "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        **details,
+    }
+    with open(fingerprint_file, "w", encoding="utf-8") as f:
+        json.dump(recorded, f, indent=2)
@@ -7,6 +7,44 @@ import os
 import sys
 import time
 
+# Shared pipeline modules (one level up, in uploads/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fingerprint import code_version, is_up_to_date, record_run, run_key  # Skip unchanged re-runs
+from snapshot_meta import snapshot_data_hash  # Version of the prepared data, read with NumPy only
+
+
+# ==============================
+# SKIP UNCHANGED RE-RUNS
+# ==============================
+
+# Checked before the imports below (pandas, matplotlib, scikit-learn), so an
+# unchanged re-run reports the stored results without loading them
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
+
+# Skip retraining when neither the data nor the code changed since the last run
+fingerprint_file = os.path.join(script_dir, "gmm_elbow_fingerprint.json")
+model_outputs = [os.path.join(script_dir, name) for name in [
+    "gmm_elbow_html_results.txt",
+    "gmm_elbow_output.csv",
+    "gmm_elbow_metrics.csv",
+    "gmm_model_elbow.pkl",
+    "gmm_elbow_lookup.npz",
+    "gmm_elbow_clusters.png",
+    "gmm_elbow_pca.png",
+    "gmm_elbow_fit_time.png",
+]]
+training_key = run_key(snapshot_data_hash(file_path), code_version(__file__))
+if is_up_to_date(fingerprint_file, training_key, model_outputs):
+    print("Data unchanged since the last run; reusing the existing GMM Elbow results")
+    sys.exit(0)
+
+
+# ==============================
+# TRAINING IMPORTS
+# ==============================
+
 # Third-Party Library Imports (external dependencies)
 import joblib  # For saving and loading models
 import pandas as pd  # Data manipulation library
@@ -17,12 +55,16 @@ from scipy.spatial.distance import cdist
 from yellowbrick.cluster import KElbowVisualizer
 
 # Machine Learning & Preprocessing Imports
-from sklearn.decomposition import PCA
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from matplotlib.colors import ListedColormap
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
-from sklearn.mixture import GaussianMixture
+
+# Shared pipeline modules
+from data_snapshot import load_data_ready, load_doc_mask  # Fast typed snapshot of data_ready.xlsx
+from doc_mask import present_counts  # Popcount of the packed document flags
+from patterns import fit_pattern_gmm, pattern_histogram  # Fit on unique document patterns
+from feature_store import load_features, load_projection  # Scaled features and 2-D PCA shared by all trainers
+from evaluation import pattern_scores  # Silhouette/CH/DB from weighted document patterns
+from lookup import build_lookup, write_lookup  # Mask -> cluster table of the model
 
 gmm_html_content = ""
 
@@ -39,11 +81,9 @@ def df_to_datatable_html(df, title, table_id, index):
 # LOAD DATA
 # ==============================
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
-
 try:
-    df = pd.read_excel(file_path, index_col=0)
+    df = load_data_ready(file_path, compact=True)  # Categorical/int8 columns instead of object/int64
+    doc_mask = load_doc_mask(file_path)  # None when data_ready has no packed mask
 except FileNotFoundError:
     print(f"Error: File not found at {file_path}")
     sys.exit(1)
@@ -61,8 +101,8 @@ doc_columns = [
     "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
 ]
 
-df_gmm = df.copy()
-df_gmm.loc[:, 'Completeness_Percentage'] = (df_gmm[doc_columns].sum(axis=1) / len(doc_columns)) * 100
+df_gmm = df  # No defensive copy: df is not used on its own again
+df_gmm.loc[:, 'Completeness_Percentage'] = (present_counts(df_gmm, doc_columns, doc_mask) / len(doc_columns)) * 100
 weight_factor = 5
 df_gmm['Weighted_Completeness'] = df_gmm['Completeness_Percentage'] * weight_factor
 df_gmm_for_clustering = df_gmm[doc_columns + ['Weighted_Completeness']]
@@ -71,8 +111,13 @@ df_gmm_for_clustering = df_gmm[doc_columns + ['Weighted_Completeness']]
 # DATA SCALING
 # ==============================
 
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_gmm_for_clustering)
+# Fitted once per data version and shared by all trainers (memory-mapped, read-only)
+X_scaled, scaler = load_features(file_path, df_gmm_for_clustering)
+
+# The sweep fits every k on the unique document patterns weighted by their row
+# counts; BIC and AIC count each pattern once per row, as on the full matrix
+patterns = pattern_histogram(X_scaled, doc_mask)
+X_patterns, pattern_counts, _ = patterns
 
 # ==============================
 # ELBOW METHOD TO FIND BEST K (BIC/AIC)
@@ -84,10 +129,9 @@ fit_times = []
 K = range(1, 11)
 for k in K:
     start = time.time()
-    gmm = GaussianMixture(n_components=k, random_state=42, covariance_type="tied")
-    gmm.fit(X_scaled)
-    bics.append(gmm.bic(X_scaled))
-    aics.append(gmm.aic(X_scaled))
+    gmm, _ = fit_pattern_gmm(patterns, n_components=k, random_state=42)
+    bics.append(gmm.bic(X_patterns, sample_weight=pattern_counts))
+    aics.append(gmm.aic(X_patterns, sample_weight=pattern_counts))
     fit_times.append(time.time() - start)
 
 # Use KneeLocator to find the elbow for BIC
@@ -134,8 +178,8 @@ plt.close(fig)
 # GMM WITH BEST K
 # ==============================
 
-gmm = GaussianMixture(n_components=best_k, random_state=42, covariance_type="tied")
-df_gmm.loc[:, 'Cluster'] = gmm.fit_predict(X_scaled)
+gmm, row_labels = fit_pattern_gmm(patterns, n_components=best_k, random_state=42)
+df_gmm.loc[:, 'Cluster'] = row_labels
 model_output = os.path.join(script_dir, "gmm_model_elbow.pkl")
 joblib.dump(gmm, model_output)
 
@@ -143,8 +187,16 @@ joblib.dump(gmm, model_output)
 # ASSIGN CLUSTER LABELS AS "CLUSTER 1", "CLUSTER 2", ...
 # ==============================
 
-df_gmm['Cluster_Label'] = df_gmm['Cluster'].apply(lambda x: f"Cluster {x+1}")
 cluster_labels = [f"Cluster {i+1}" for i in range(best_k)]
+# Categorical labels: cluster i is code i, so no string is built per row
+df_gmm['Cluster_Label'] = pd.Categorical.from_codes(df_gmm['Cluster'], cluster_labels)
+
+# Tabulate the model over every document mask, so new rows can be assigned a
+# cluster and label by indexing the table with their mask (see lookup.py)
+lookup_output = os.path.join(script_dir, "gmm_elbow_lookup.npz")
+write_lookup(lookup_output, build_lookup(gmm, scaler, len(doc_columns), weight_factor),
+             cluster_labels, doc_columns,
+             model="gmm_model_elbow.pkl", weight_factor=weight_factor, data_sha256=snapshot_data_hash(file_path))
 
 # ==============================
 # EXPORT CLUSTERED DATA
@@ -177,9 +229,8 @@ plt.close()
 # CLUSTERING METRICS
 # ==============================
 
-silhouette = silhouette_score(X_scaled, df_gmm['Cluster'])
-calinski_harabasz = calinski_harabasz_score(X_scaled, df_gmm['Cluster'])
-davies_bouldin = davies_bouldin_score(X_scaled, df_gmm['Cluster'])
+# Exact scores of the rows, computed between the distinct (pattern, cluster) pairs weighted by their counts
+silhouette, calinski_harabasz, davies_bouldin = pattern_scores(patterns, df_gmm['Cluster'])
 
 metrics_dict = {
     "Metric": ["Silhouette Score", "Calinski-Harabasz Index", "Davies-Bouldin Index"],
@@ -194,8 +245,8 @@ gmm_html_content += df_to_datatable_html(metrics_df, "GMM Elbow Metrics", "gmm_e
 # PCA VISUALIZATION
 # ==============================
 
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
+# Fitted once per data version and shared by all trainers; only the labels and centroids are ours
+X_pca, pca = load_projection(X_scaled)
 custom_cmap = ListedColormap(matplotlib.colormaps['tab10'].colors[:best_k])
 plt.figure(figsize=(10, 8))
 scatter = plt.scatter(X_pca[:, 0], X_pca[:, 1], c=df_gmm['Cluster'], cmap=custom_cmap, edgecolors='k', s=50)
@@ -219,7 +270,7 @@ plt.close()
 # ==============================
 
 def group_and_report(df, group_col, report_name):
-    cluster_count = df.groupby(group_col)['Cluster_Label'].value_counts().unstack(fill_value=0)
+    cluster_count = df.groupby(group_col, observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
     cluster_count = cluster_count.reindex(columns=cluster_labels, fill_value=0)
     cluster_count['Total'] = cluster_count[cluster_labels].sum(axis=1)
     # Assign weights: Cluster 1 = best, Cluster 2 = next, etc.
@@ -246,3 +297,6 @@ with open(html_log_file, "w", encoding="utf-8") as f:
     f.write(gmm_html_content)
 
 print(f"All DataFrames saved as HTML in: {html_log_file}")
+
+# Remember the inputs of this run so an unchanged re-run can be skipped
+record_run(fingerprint_file, training_key, model_outputs)
@@ -6,31 +6,73 @@
 import os
 import sys
 
+# Shared pipeline modules (one level up, in uploads/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fingerprint import code_version, is_up_to_date, record_run, run_key  # Skip unchanged re-runs
+from snapshot_meta import snapshot_data_hash  # Version of the prepared data, read with NumPy only
+
+
+# ==============================
+# SKIP UNCHANGED RE-RUNS
+# ==============================
+
+# Checked before the imports below (pandas, matplotlib, scikit-learn), so an
+# unchanged re-run reports the stored results without loading them
+
+# Get the script's directory and define the data file path (one level up)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
+
+# Skip retraining when neither the data nor the code changed since the last run
+fingerprint_file = os.path.join(script_dir, "gmm_fingerprint.json")
+model_outputs = [os.path.join(script_dir, name) for name in [
+    "gmm_html_results.txt",
+    "gmm_output.csv",
+    "gmm_metrics.csv",
+    "gmm_model.pkl",
+    "gmm_lookup.npz",
+    "gmm_clusters.png",
+    "gmm_pca.png",
+    "gmm_confusion_matrix.png",
+]]
+training_key = run_key(snapshot_data_hash(file_path), code_version(__file__))
+if is_up_to_date(fingerprint_file, training_key, model_outputs):
+    print("Data unchanged since the last run; reusing the existing GMM results")
+    sys.exit(0)
+
+
+# ==============================
+# TRAINING IMPORTS
+# ==============================
+
 # Third-Party Library Imports (external dependencies)
 import joblib  # For saving and loading models
 import pandas as pd  # Data manipulation library
 import matplotlib.pyplot as plt  # Data visualization
 
 
-from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from matplotlib.colors import ListedColormap
 
 
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
 
 
 # Scikit-Learn Imports (machine learning & preprocessing)
-from sklearn.mixture import GaussianMixture  # Gaussian clustering algorithm
-from sklearn.preprocessing import StandardScaler  # Data normalization
 from sklearn.metrics import (  # Model evaluation metrics
     confusion_matrix,
     classification_report,
     ConfusionMatrixDisplay
 )
 
+# Shared pipeline modules
+from data_snapshot import load_data_ready, load_doc_mask  # Fast typed snapshot of data_ready.xlsx
+from doc_mask import present_counts  # Popcount of the packed document flags
+from patterns import fit_pattern_gmm, pattern_histogram  # Fit on unique document patterns
+from feature_store import load_features, load_projection  # Scaled features and 2-D PCA shared by all trainers
+from evaluation import pattern_scores  # Silhouette/CH/DB from weighted document patterns
+from lookup import build_lookup, write_lookup  # Mask -> cluster table of the model
+
 
 gmm_html_content = ""
 
@@ -51,13 +93,10 @@ def df_to_datatable_html(df, title, table_id, index):
 # LOAD DATA
 # ==============================
 
-# Get the script's directory and define the data file path (one level up)
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
-
 # Try to load the Excel file; exit script if an error occurs
 try:
-    df = pd.read_excel(file_path, index_col=0)
+    df = load_data_ready(file_path, compact=True)  # Categorical/int8 columns instead of object/int64
+    doc_mask = load_doc_mask(file_path)  # None when data_ready has no packed mask
 except FileNotFoundError:
     print(f"Error: File not found at {file_path}")
     sys.exit(1)  # Exit script if file is missing
@@ -77,11 +116,12 @@ doc_columns = [
     "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
 ]
 
-# Create a copy of the dataframe to avoid modifying original data
-df_gmm = df.copy()
+# Work on the loaded frame itself: df is not used on its own again and a
+# full copy would double the working set
+df_gmm = df
 
 # Compute the completeness percentage for each row (how many required documents are present)
-df_gmm.loc[:, 'Completeness_Percentage'] = (df_gmm[doc_columns].sum(axis=1) / len(doc_columns)) * 100
+df_gmm.loc[:, 'Completeness_Percentage'] = (present_counts(df_gmm, doc_columns, doc_mask) / len(doc_columns)) * 100
 
 # Apply a weighting factor to emphasize document completeness in clustering
 weight_factor = 5  
@@ -95,12 +135,15 @@ df_gmm_for_clustering = df_gmm[doc_columns + ['Weighted_Completeness']]
 # ==============================
 
 # Normalize feature values to improve clustering performance
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_gmm_for_clustering)
+# Fitted once per data version and shared by all trainers (memory-mapped, read-only)
+X_scaled, scaler = load_features(file_path, df_gmm_for_clustering)
 
-# Perform GMM clustering with 3 clusters
-gmm = GaussianMixture(n_components=3, random_state=42, covariance_type="tied")
-df_gmm.loc[:, 'Cluster'] = gmm.fit_predict(X_scaled)  
+# Perform GMM clustering with 3 clusters on the unique document patterns: EM
+# weighted by the row counts gives the mixture GaussianMixture(n_components=3,
+# random_state=42, covariance_type="tied") fits on every row
+patterns = pattern_histogram(X_scaled, doc_mask)
+gmm, row_labels = fit_pattern_gmm(patterns, n_components=3, random_state=42)
+df_gmm.loc[:, 'Cluster'] = row_labels
 
 # Save the trained GMM model
 model_output = os.path.join(script_dir, "gmm_model.pkl")
@@ -116,9 +159,19 @@ cluster_medians = df_gmm.groupby('Cluster')['Completeness_Percentage'].median()
 # Sort clusters based on completeness levels
 sorted_clusters = cluster_medians.sort_values()
 
+# Labels as a categorical (one small code per row instead of a Python string)
+label_dtype = pd.CategoricalDtype(['Low', 'Medium', 'High'])
+
 # Map cluster indexes to labels ('Low', 'Medium', 'High') based on completeness level
 cluster_mapping = {sorted_clusters.index[0]: 'Low', sorted_clusters.index[1]: 'Medium', sorted_clusters.index[2]: 'High'}
-df_gmm['Cluster_Label'] = df_gmm['Cluster'].map(cluster_mapping)
+df_gmm['Cluster_Label'] = df_gmm['Cluster'].map(cluster_mapping).astype(label_dtype)
+
+# Tabulate the model over every document mask, so new rows can be assigned a
+# cluster and label by indexing the table with their mask (see lookup.py)
+lookup_output = os.path.join(script_dir, "gmm_lookup.npz")
+write_lookup(lookup_output, build_lookup(gmm, scaler, len(doc_columns), weight_factor),
+             [cluster_mapping[cluster] for cluster in range(len(cluster_mapping))], doc_columns,
+             model="gmm_model.pkl", weight_factor=weight_factor, data_sha256=snapshot_data_hash(file_path))
 
 # ==============================
 # EXPORT CLUSTERED DATA
@@ -178,18 +231,19 @@ def classify_completeness(percentage):
         return 'Low'
 
 # Apply classification function to assign ground truth labels
-df_gmm['Actual_Label'] = df_gmm['Completeness_Percentage'].apply(classify_completeness)
+# Same rule as classify_completeness, applied to the whole column at once
+df_gmm['Actual_Label'] = pd.cut(df_gmm['Completeness_Percentage'], bins=[-np.inf, medium_threshold, high_threshold, np.inf],
+                                 labels=label_dtype.categories, ordered=False).astype(label_dtype)
 
 # Compute accuracy by comparing predicted clusters with actual labels
 correct_predictions = (df_gmm['Actual_Label'] == df_gmm['Cluster_Label']).sum()
-df_gmm['Cluster_Label'] = df_gmm['Cluster'].map(cluster_mapping)
+df_gmm['Cluster_Label'] = df_gmm['Cluster'].map(cluster_mapping).astype(label_dtype)
 
 
 # Compute metrics
 accuracy = correct_predictions / len(df_gmm)
-silhouette = silhouette_score(X_scaled, df_gmm['Cluster'])
-calinski_harabasz = calinski_harabasz_score(X_scaled, df_gmm['Cluster'])
-davies_bouldin = davies_bouldin_score(X_scaled, df_gmm['Cluster'])
+# Exact scores of the rows, computed between the distinct (pattern, cluster) pairs weighted by their counts
+silhouette, calinski_harabasz, davies_bouldin = pattern_scores(patterns, df_gmm['Cluster'])
 
 # Store results in a dictionary
 metrics_dict = {
@@ -269,8 +323,8 @@ gmm_html_content += df_to_datatable_html(report_df, "GMM Classification Report",
 # ================================
 
 # Apply PCA for dimensionality reduction (reduce to 2D)
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
+# Fitted once per data version and shared by all trainers; only the labels and centroids are ours
+X_pca, pca = load_projection(X_scaled)
 
 # Define custom colors for clusters
 custom_cmap = ListedColormap(['blue', 'orange', 'green'])
@@ -326,7 +380,7 @@ plt.close()
 # =============================================
 
 # Group by 'UNIT KERJA' and get the counts of each cluster label
-cluster_count_per_unit = df_gmm.groupby('UNIT KERJA')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_unit = df_gmm.groupby('UNIT KERJA', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_unit = cluster_count_per_unit[['High', 'Medium', 'Low']]
@@ -362,7 +416,7 @@ gmm_html_content += df_to_datatable_html(cluster_count_per_unit_sorted, "GMM Gro
 # =============================================
 
 # Group by 'TINGKAT' and get the counts of each cluster label
-cluster_count_per_tingkat = df_gmm.groupby('TINGKAT')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_tingkat = df_gmm.groupby('TINGKAT', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_tingkat = cluster_count_per_tingkat[['High', 'Medium', 'Low']]
@@ -401,7 +455,7 @@ gmm_html_content += df_to_datatable_html(cluster_count_per_tingkat_sorted, "GMM
 
 
 # Group by 'LOKASI' and get the counts of each cluster label
-cluster_count_per_lokasi = df_gmm.groupby('LOKASI')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_lokasi = df_gmm.groupby('LOKASI', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_lokasi = cluster_count_per_lokasi[['High', 'Medium', 'Low']]
@@ -438,7 +492,7 @@ gmm_html_content += df_to_datatable_html(cluster_count_per_lokasi_sorted, "GMM G
 
 
 # Group by 'PROVINSI' and get the counts of each cluster label
-cluster_count_per_provinsi = df_gmm.groupby('PROVINSI')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_provinsi = df_gmm.groupby('PROVINSI', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_provinsi = cluster_count_per_provinsi[['High', 'Medium', 'Low']]
@@ -475,7 +529,7 @@ gmm_html_content += df_to_datatable_html(cluster_count_per_provinsi_sorted, "GMM
 
 
 # Group by 'STATUS' and get the counts of each cluster label
-cluster_count_per_status = df_gmm.groupby('STATUS')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_status = df_gmm.groupby('STATUS', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_status = cluster_count_per_status[['High', 'Medium', 'Low']]
@@ -514,7 +568,7 @@ gmm_html_content += df_to_datatable_html(cluster_count_per_status_sorted, "GMM G
 # ===================================================
 
 # Group by 'JENIS KELAMIN' and get the counts of each cluster label
-cluster_count_per_jk = df_gmm.groupby('JENIS KELAMIN')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_jk = df_gmm.groupby('JENIS KELAMIN', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_jk = cluster_count_per_jk[['High', 'Medium', 'Low']]
@@ -553,3 +607,6 @@ with open(html_log_file, "w", encoding="utf-8") as f:
     f.write(gmm_html_content)
 
 print(f"All DataFrames saved as HTML in: {html_log_file}")
+
+# Remember the inputs of this run so an unchanged re-run can be skipped
+record_run(fingerprint_file, training_key, model_outputs)
@@ -4,19 +4,60 @@
 
 import os
 import sys
+import time
+
+# Shared pipeline modules (one level up, in uploads/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fingerprint import code_version, is_up_to_date, record_run, run_key  # Skip unchanged re-runs
+from snapshot_meta import snapshot_data_hash  # Version of the prepared data, read with NumPy only
+
+
+# ==============================
+# SKIP UNCHANGED RE-RUNS
+# ==============================
+
+# Checked before the imports below (pandas, matplotlib, scikit-learn), so an
+# unchanged re-run reports the stored results without loading them
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
+
+# Skip retraining when neither the data nor the code changed since the last run
+fingerprint_file = os.path.join(script_dir, "hierarchical_elbow_fingerprint.json")
+model_outputs = [os.path.join(script_dir, name) for name in [
+    "hierarchical_elbow_html_results.txt",
+    "hierarchical_elbow_output.csv",
+    "hierarchical_elbow_metrics.csv",
+    "hierarchical_elbow_dendrogram.png",
+    "hierarchical_elbow_clusters.png",
+    "hierarchical_elbow_pca.png",
+    "hierarchical_elbow_fit_time.png",
+]]
+training_key = run_key(snapshot_data_hash(file_path), code_version(__file__))
+if is_up_to_date(fingerprint_file, training_key, model_outputs):
+    print("Data unchanged since the last run; reusing the existing Hierarchical Elbow results")
+    sys.exit(0)
+
+
+# ==============================
+# TRAINING IMPORTS
+# ==============================
+
 import joblib
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib
 import numpy as np
 from kneed import KneeLocator
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 from matplotlib.colors import ListedColormap
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
-from sklearn.cluster import AgglomerativeClustering
 import scipy.cluster.hierarchy as sch
-import time
+
+# Shared pipeline modules
+from data_snapshot import load_data_ready, load_doc_mask  # Fast typed snapshot of data_ready.xlsx
+from doc_mask import present_counts  # Popcount of the packed document flags
+from feature_store import load_features, load_projection  # Scaled features and 2-D PCA shared by all trainers
+from evaluation import pattern_scores  # Silhouette/CH/DB from weighted document patterns
+from patterns import fit_pattern_ward, pattern_histogram, pattern_ward_linkage, row_count_labels, row_merge_distances  # Fit on unique document patterns
 
 hierarchical_html_content = ""
 
@@ -33,11 +74,9 @@ def df_to_datatable_html(df, title, table_id, index):
 # LOAD DATA
 # ==============================
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
-
 try:
-    df = pd.read_excel(file_path, index_col=0)
+    df = load_data_ready(file_path, compact=True)  # Categorical/int8 columns instead of object/int64
+    doc_mask = load_doc_mask(file_path)  # None when data_ready has no packed mask
 except FileNotFoundError:
     print(f"Error: File not found at {file_path}")
     sys.exit(1)
@@ -55,8 +94,8 @@ doc_columns = [
     "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
 ]
 
-df_hier = df.copy()
-df_hier.loc[:, 'Completeness_Percentage'] = (df_hier[doc_columns].sum(axis=1) / len(doc_columns)) * 100
+df_hier = df  # No defensive copy: df is not used on its own again
+df_hier.loc[:, 'Completeness_Percentage'] = (present_counts(df_hier, doc_columns, doc_mask) / len(doc_columns)) * 100
 weight_factor = 5
 df_hier['Weighted_Completeness'] = df_hier['Completeness_Percentage'] * weight_factor
 df_hier_for_clustering = df_hier[doc_columns + ['Weighted_Completeness']]
@@ -65,20 +104,24 @@ df_hier_for_clustering = df_hier[doc_columns + ['Weighted_Completeness']]
 # DATA SCALING
 # ==============================
 
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_hier_for_clustering)
+# Fitted once per data version and shared by all trainers (memory-mapped, read-only)
+X_scaled, scaler = load_features(file_path, df_hier_for_clustering)
 
 # ==============================
 # ELBOW METHOD FOR HIERARCHICAL (DENDROGRAM & LINKAGE DISTANCES)
 # ==============================
 
-# Compute linkage matrix for dendrogram and elbow
-linkage_matrix = sch.linkage(X_scaled, method='ward')
+# Compute linkage matrix for dendrogram and elbow, on the unique document
+# patterns weighted by their row counts: the same tree as sch.linkage(X_scaled,
+# method='ward') above its zero-distance merges, in memory bounded by the patterns
+patterns = pattern_histogram(X_scaled, doc_mask)
+linkage_matrix = pattern_ward_linkage(patterns)
 
 # Plot dendrogram (truncated)
 plt.figure(figsize=(12, 6))
 dendrogram = sch.dendrogram(
     linkage_matrix,
+    leaf_label_func=row_count_labels(linkage_matrix, patterns[1]),  # Leaves labelled with their row counts
     truncate_mode='level',
     p=5
 )
@@ -91,7 +134,9 @@ plt.savefig(dendrogram_output, dpi=300, bbox_inches="tight")
 plt.close()
 
 # Plot linkage distances and fit times (manual elbow plot)
-last = linkage_matrix[-10:, 2]
+# Merge distances of the row tree: the pattern merges after the zero-distance
+# merges of identical rows, so there are always 10 even with few patterns
+last = row_merge_distances(linkage_matrix, len(X_scaled))[-10:]
 num_clusters = range(1, 11)
 reversed_last = last[::-1]
 
@@ -104,7 +149,7 @@ best_k = kneedle.elbow if kneedle.elbow is not None else 3
 fit_times = []
 for k in num_clusters:
     start = time.time()
-    AgglomerativeClustering(n_clusters=k, metric='euclidean', linkage='ward').fit(X_scaled)
+    fit_pattern_ward(patterns, n_clusters=k)
     fit_times.append(time.time() - start)
 
 fig, ax1 = plt.subplots(figsize=(8, 6))
@@ -146,15 +191,17 @@ print(f"Best K found by elbow method (linkage): {best_k}")
 # HIERARCHICAL CLUSTERING WITH BEST K
 # ==============================
 
-hierarchical = AgglomerativeClustering(n_clusters=best_k, metric='euclidean', linkage='ward')
-df_hier.loc[:, 'Cluster'] = hierarchical.fit_predict(X_scaled)
+# Cut the tree above like AgglomerativeClustering(n_clusters=best_k, linkage='ward') on every row
+_, row_labels = fit_pattern_ward(patterns, n_clusters=best_k, linkage_matrix=linkage_matrix)
+df_hier.loc[:, 'Cluster'] = row_labels
 
 # ==============================
 # ASSIGN CLUSTER LABELS AS "CLUSTER 1", "CLUSTER 2", ...
 # ==============================
 
-df_hier['Cluster_Label'] = df_hier['Cluster'].apply(lambda x: f"Cluster {x+1}")
 cluster_labels = [f"Cluster {i+1}" for i in range(best_k)]
+# Categorical labels: cluster i is code i, so no string is built per row
+df_hier['Cluster_Label'] = pd.Categorical.from_codes(df_hier['Cluster'], cluster_labels)
 
 # ==============================
 # EXPORT CLUSTERED DATA
@@ -187,9 +234,8 @@ plt.close()
 # CLUSTERING METRICS
 # ==============================
 
-silhouette = silhouette_score(X_scaled, df_hier['Cluster'])
-calinski_harabasz = calinski_harabasz_score(X_scaled, df_hier['Cluster'])
-davies_bouldin = davies_bouldin_score(X_scaled, df_hier['Cluster'])
+# Exact scores of the rows, computed between the distinct (pattern, cluster) pairs weighted by their counts
+silhouette, calinski_harabasz, davies_bouldin = pattern_scores(patterns, df_hier['Cluster'])
 
 metrics_dict = {
     "Metric": ["Silhouette Score", "Calinski-Harabasz Index", "Davies-Bouldin Index"],
@@ -204,8 +250,8 @@ hierarchical_html_content += df_to_datatable_html(metrics_df, "Hierarchical Elbo
 # PCA VISUALIZATION
 # ==============================
 
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
+# Fitted once per data version and shared by all trainers; only the labels and centroids are ours
+X_pca, pca = load_projection(X_scaled)
 custom_cmap = ListedColormap(matplotlib.colormaps['tab10'].colors[:best_k])
 plt.figure(figsize=(10, 8))
 scatter = plt.scatter(X_pca[:, 0], X_pca[:, 1], c=df_hier['Cluster'], cmap=custom_cmap, edgecolors='k', s=50)
@@ -232,7 +278,7 @@ plt.close()
 # ==============================
 
 def group_and_report(df, group_col, report_name):
-    cluster_count = df.groupby(group_col)['Cluster_Label'].value_counts().unstack(fill_value=0)
+    cluster_count = df.groupby(group_col, observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
     cluster_count = cluster_count.reindex(columns=cluster_labels, fill_value=0)
     cluster_count['Total'] = cluster_count[cluster_labels].sum(axis=1)
     # Assign weights: Cluster 1 = best, Cluster 2 = next, etc.
@@ -259,3 +305,6 @@ with open(html_log_file, "w", encoding="utf-8") as f:
     f.write(hierarchical_html_content)
 
 print(f"All DataFrames saved as HTML in: {html_log_file}")
+
+# Remember the inputs of this run so an unchanged re-run can be skipped
+record_run(fingerprint_file, training_key, model_outputs)
@@ -6,32 +6,72 @@
 import os
 import sys
 
+# Shared pipeline modules (one level up, in uploads/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fingerprint import code_version, is_up_to_date, record_run, run_key  # Skip unchanged re-runs
+from snapshot_meta import snapshot_data_hash  # Version of the prepared data, read with NumPy only
+
+
+# ==============================
+# SKIP UNCHANGED RE-RUNS
+# ==============================
+
+# Checked before the imports below (pandas, matplotlib, scikit-learn), so an
+# unchanged re-run reports the stored results without loading them
+
+# Get the script's directory and define the data file path (one level up)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
+
+# Skip retraining when neither the data nor the code changed since the last run
+fingerprint_file = os.path.join(script_dir, "hierarchical_fingerprint.json")
+model_outputs = [os.path.join(script_dir, name) for name in [
+    "hierarchical_html_results.txt",
+    "hierarchical_output.csv",
+    "hierarchical_metrics.csv",
+    "hierarchical_dendrogram.png",
+    "hierarchical_clusters.png",
+    "hierarchical_pca.png",
+    "hierarchical_confusion_matrix.png",
+]]
+training_key = run_key(snapshot_data_hash(file_path), code_version(__file__))
+if is_up_to_date(fingerprint_file, training_key, model_outputs):
+    print("Data unchanged since the last run; reusing the existing Hierarchical results")
+    sys.exit(0)
+
+
+# ==============================
+# TRAINING IMPORTS
+# ==============================
+
 # Third-Party Library Imports (external dependencies)
 import joblib  # For saving and loading models
 import pandas as pd  # Data manipulation library
 import matplotlib.pyplot as plt  # Data visualization
 
 
-from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from matplotlib.colors import ListedColormap
 
 
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
 
 
 # Scikit-Learn Imports (machine learning & preprocessing)
-from sklearn.cluster import AgglomerativeClustering  # Hierarchical Clustering algorithm
 import scipy.cluster.hierarchy as sch  # Dendrogram plotting
-from sklearn.preprocessing import StandardScaler  # Data normalization
 from sklearn.metrics import (  # Model evaluation metrics
     confusion_matrix,
     classification_report,
     ConfusionMatrixDisplay
 )
 
+# Shared pipeline modules
+from data_snapshot import load_data_ready, load_doc_mask  # Fast typed snapshot of data_ready.xlsx
+from doc_mask import present_counts  # Popcount of the packed document flags
+from feature_store import load_features, load_projection  # Scaled features and 2-D PCA shared by all trainers
+from evaluation import pattern_scores  # Silhouette/CH/DB from weighted document patterns
+from patterns import fit_pattern_ward, pattern_histogram, pattern_ward_linkage, row_count_labels  # Fit on unique document patterns
+
 
 hierarchical_html_content = ""
 
@@ -52,13 +92,10 @@ def df_to_datatable_html(df, title, table_id, index):
 # LOAD DATA
 # ==============================
 
-# Get the script's directory and define the data file path (one level up)
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
-
 # Try to load the Excel file; exit script if an error occurs
 try:
-    df = pd.read_excel(file_path, index_col=0)
+    df = load_data_ready(file_path, compact=True)  # Categorical/int8 columns instead of object/int64
+    doc_mask = load_doc_mask(file_path)  # None when data_ready has no packed mask
 except FileNotFoundError:
     print(f"Error: File not found at {file_path}")
     sys.exit(1)  # Exit script if file is missing
@@ -78,11 +115,12 @@ doc_columns = [
     "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
 ]
 
-# Create a copy of the dataframe to avoid modifying original data
-df_hierarchical = df.copy()
+# Work on the loaded frame itself: df is not used on its own again and a
+# full copy would double the working set
+df_hierarchical = df
 
 # Compute the completeness percentage for each row (how many required documents are present)
-df_hierarchical.loc[:, 'Completeness_Percentage'] = (df_hierarchical[doc_columns].sum(axis=1) / len(doc_columns)) * 100
+df_hierarchical.loc[:, 'Completeness_Percentage'] = (present_counts(df_hierarchical, doc_columns, doc_mask) / len(doc_columns)) * 100
 
 # Apply a weighting factor to emphasize document completeness in clustering
 weight_factor = 5  
@@ -96,12 +134,19 @@ df_hierarchical_for_clustering = df_hierarchical[doc_columns + ['Weighted_Comple
 # ==============================
 
 # Normalize feature values to improve clustering performance
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_hierarchical_for_clustering)
+# Fitted once per data version and shared by all trainers (memory-mapped, read-only)
+X_scaled, scaler = load_features(file_path, df_hierarchical_for_clustering)
+
+# Ward linkage of the unique document patterns, each starting as a cluster of
+# the rows that share it: the tree sch.linkage(X_scaled, method='ward') builds
+# above its zero-distance merges, without an n x n distance matrix of the rows
+patterns = pattern_histogram(X_scaled, doc_mask)
+linkage_matrix = pattern_ward_linkage(patterns)
 
 plt.figure(figsize=(12, 6))
 dendrogram = sch.dendrogram(
-    sch.linkage(X_scaled, method='ward'),
+    linkage_matrix,
+    leaf_label_func=row_count_labels(linkage_matrix, patterns[1]),  # Leaves labelled with their row counts
     truncate_mode='level',  # Show only the top levels of the hierarchy
     p=5  # Show the last 5 levels of the dendrogram
 )
@@ -114,9 +159,10 @@ dendrogram_output = os.path.join(script_dir, "hierarchical_dendrogram.png")
 plt.savefig(dendrogram_output, dpi=300, bbox_inches="tight")  
 # plt.show()
 
-# Perform Hierarchical clustering with 3 clusters
-hierarchical = AgglomerativeClustering(n_clusters=3, metric='euclidean', linkage='ward')
-df_hierarchical.loc[:, 'Cluster'] = hierarchical.fit_predict(X_scaled)  
+# Perform Hierarchical clustering with 3 clusters: the tree cut and numbered
+# like AgglomerativeClustering(n_clusters=3, linkage='ward') on every row
+_, row_labels = fit_pattern_ward(patterns, n_clusters=3, linkage_matrix=linkage_matrix)
+df_hierarchical.loc[:, 'Cluster'] = row_labels
 
 # Save the trained Hierarchical model
 # model_output = os.path.join(script_dir, "hierarchical_model.pkl")
@@ -132,9 +178,12 @@ cluster_medians = df_hierarchical.groupby('Cluster')['Completeness_Percentage'].
 # Sort clusters based on completeness levels
 sorted_clusters = cluster_medians.sort_values()
 
+# Labels as a categorical (one small code per row instead of a Python string)
+label_dtype = pd.CategoricalDtype(['Low', 'Medium', 'High'])
+
 # Map cluster indexes to labels ('Low', 'Medium', 'High') based on completeness level
 cluster_mapping = {sorted_clusters.index[0]: 'Low', sorted_clusters.index[1]: 'Medium', sorted_clusters.index[2]: 'High'}
-df_hierarchical['Cluster_Label'] = df_hierarchical['Cluster'].map(cluster_mapping)
+df_hierarchical['Cluster_Label'] = df_hierarchical['Cluster'].map(cluster_mapping).astype(label_dtype)
 
 # ==============================
 # EXPORT CLUSTERED DATA
@@ -195,18 +244,19 @@ def classify_completeness(percentage):
         return 'Low'
 
 # Apply classification function to assign ground truth labels
-df_hierarchical['Actual_Label'] = df_hierarchical['Completeness_Percentage'].apply(classify_completeness)
+# Same rule as classify_completeness, applied to the whole column at once
+df_hierarchical['Actual_Label'] = pd.cut(df_hierarchical['Completeness_Percentage'], bins=[-np.inf, medium_threshold, high_threshold, np.inf],
+                                 labels=label_dtype.categories, ordered=False).astype(label_dtype)
 
 # Compute accuracy by comparing predicted clusters with actual labels
 correct_predictions = (df_hierarchical['Actual_Label'] == df_hierarchical['Cluster_Label']).sum()
-df_hierarchical['Cluster_Label'] = df_hierarchical['Cluster'].map(cluster_mapping)
+df_hierarchical['Cluster_Label'] = df_hierarchical['Cluster'].map(cluster_mapping).astype(label_dtype)
 
 
 # Compute metrics
 accuracy = correct_predictions / len(df_hierarchical)
-silhouette = silhouette_score(X_scaled, df_hierarchical['Cluster'])
-calinski_harabasz = calinski_harabasz_score(X_scaled, df_hierarchical['Cluster'])
-davies_bouldin = davies_bouldin_score(X_scaled, df_hierarchical['Cluster'])
+# Exact scores of the rows, computed between the distinct (pattern, cluster) pairs weighted by their counts
+silhouette, calinski_harabasz, davies_bouldin = pattern_scores(patterns, df_hierarchical['Cluster'])
 
 # Store results in a dictionary
 metrics_dict = {
@@ -286,8 +336,8 @@ hierarchical_html_content += df_to_datatable_html(report_df, "Hierarchical Class
 # ================================
 
 # Apply PCA for dimensionality reduction (reduce to 2D)
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
+# Fitted once per data version and shared by all trainers; only the labels and centroids are ours
+X_pca, pca = load_projection(X_scaled)
 
 # Define custom colors for clusters
 custom_cmap = ListedColormap(['blue', 'orange', 'green'])
@@ -351,7 +401,7 @@ plt.close()
 # =============================================
 
 # Group by 'UNIT KERJA' and get the counts of each cluster label
-cluster_count_per_unit = df_hierarchical.groupby('UNIT KERJA')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_unit = df_hierarchical.groupby('UNIT KERJA', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_unit = cluster_count_per_unit[['High', 'Medium', 'Low']]
@@ -387,7 +437,7 @@ hierarchical_html_content += df_to_datatable_html(cluster_count_per_unit_sorted,
 # =============================================
 
 # Group by 'TINGKAT' and get the counts of each cluster label
-cluster_count_per_tingkat = df_hierarchical.groupby('TINGKAT')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_tingkat = df_hierarchical.groupby('TINGKAT', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_tingkat = cluster_count_per_tingkat[['High', 'Medium', 'Low']]
@@ -426,7 +476,7 @@ hierarchical_html_content += df_to_datatable_html(cluster_count_per_tingkat_sort
 
 
 # Group by 'LOKASI' and get the counts of each cluster label
-cluster_count_per_lokasi = df_hierarchical.groupby('LOKASI')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_lokasi = df_hierarchical.groupby('LOKASI', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_lokasi = cluster_count_per_lokasi[['High', 'Medium', 'Low']]
@@ -463,7 +513,7 @@ hierarchical_html_content += df_to_datatable_html(cluster_count_per_lokasi_sorte
 
 
 # Group by 'PROVINSI' and get the counts of each cluster label
-cluster_count_per_provinsi = df_hierarchical.groupby('PROVINSI')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_provinsi = df_hierarchical.groupby('PROVINSI', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_provinsi = cluster_count_per_provinsi[['High', 'Medium', 'Low']]
@@ -500,7 +550,7 @@ hierarchical_html_content += df_to_datatable_html(cluster_count_per_provinsi_sor
 
 
 # Group by 'STATUS' and get the counts of each cluster label
-cluster_count_per_status = df_hierarchical.groupby('STATUS')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_status = df_hierarchical.groupby('STATUS', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_status = cluster_count_per_status[['High', 'Medium', 'Low']]
@@ -539,7 +589,7 @@ hierarchical_html_content += df_to_datatable_html(cluster_count_per_status_sorte
 # ===================================================
 
 # Group by 'JENIS KELAMIN' and get the counts of each cluster label
-cluster_count_per_jk = df_hierarchical.groupby('JENIS KELAMIN')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_jk = df_hierarchical.groupby('JENIS KELAMIN', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_jk = cluster_count_per_jk[['High', 'Medium', 'Low']]
@@ -578,3 +628,6 @@ with open(html_log_file, "w", encoding="utf-8") as f:
     f.write(hierarchical_html_content)
 
 print(f"All DataFrames saved as HTML in: {html_log_file}")
+
+# Remember the inputs of this run so an unchanged re-run can be skipped
+record_run(fingerprint_file, training_key, model_outputs)
@@ -0,0 +1,246 @@
+# ==============================
+# UPLOAD INGESTION
+# ==============================
+
+import csv
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from aggregation import CellAccumulator
+from columns import doc_columns, group_cols, numeric_group_cols
+from excel_reader import read_excel
+
+pd.set_option('future.no_silent_downcasting', True)
+
+# Rows handed to the accumulators at a time in streaming mode
+DEFAULT_CHUNK_SIZE = 20000
+
+# Delimited text exports and their default separator (the header line decides)
+DELIMITED_SUFFIXES = {".csv": ",", ".tsv": "\t", ".txt": "\t"}
+
+# Cell values that mark a document as present ('√' is what the sheets use)
+CHECKMARKS = ['√', '✓', '✔', '☑']
+
+
+def _parse_doc_cell(value):
+    # -> (flag, coerced) for one distinct raw value
+    if isinstance(value, str):
+        text = value.strip()
+        if text in CHECKMARKS:
+            return 1, value != CHECKMARKS[0]
+        if text == "":
+            return 0, True
+        try:
+            number = float(text)
+        except ValueError:
+            return 0, True
+        coerced = True
+    elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        number, coerced = float(value), False
+    else:
+        return 0, True
+    if number != number:  # NaN
+        return 0, coerced
+    flag = int(min(max(np.trunc(number), np.iinfo(np.int8).min), np.iinfo(np.int8).max))
+    return flag, coerced or flag != number
+
+
+def parse_doc_column(values):
+    """
+    Parse one raw document column to int8 flags in a single vectorized pass.
+
+    Check marks become 1, blanks 0 and numbers are kept; whitespace around any of
+    them is ignored and anything else becomes 0. Only the distinct values are
+    parsed, and the result is spread back over the rows by their codes. Returns
+    the flags and the number of cells that were not already '√', blank or a
+    whole number.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, copy=False))
+    parsed = [_parse_doc_cell(value) for value in uniques]
+    # Trailing entry for code -1 (empty cell)
+    flags = np.array([flag for flag, _ in parsed] + [0], dtype=np.int8)
+    coerced = np.array([was_coerced for _, was_coerced in parsed] + [False])
+    counts = np.bincount(codes + 1, minlength=len(uniques) + 1)
+    return flags[codes], int(counts[1:][coerced[:-1]].sum())
+
+
+def parse_doc_columns(df):
+    """Replace the document columns of `df` by int8 flags; returns how many cells were coerced."""
+    coerced = 0
+    for col in doc_columns:
+        if col in df.columns:
+            df[col], count = parse_doc_column(df[col].to_numpy())
+            coerced += count
+    return coerced
+
+
+def normalize_upload(df):
+    """
+    Apply the upload clean-up: tidy column names, document cells -> int8 flags,
+    empty -> 0, drop personal data. Returns the frame and the number of document
+    cells that had to be coerced.
+    """
+    # Strip leading and trailing spaces from all column names
+    df.columns = df.columns.str.strip()
+    df.columns = df.columns.str.upper()
+    df = df.drop(columns=['NAMA', 'NIP'], errors='ignore')
+
+    # '√' -> 1 and empty -> 0 for the document columns, empty/NaN -> 0 for the rest
+    coerced = parse_doc_columns(df)
+    df = df.fillna(0)
+
+    return df, coerced
+
+
+def _header_names(header):
+    # Match the names pandas gives to blank header cells
+    return [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+
+def iter_excel_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream the first sheet of a workbook as normalized DataFrame chunks, each
+    paired with its count of coerced document cells.
+
+    Uses openpyxl's read_only mode, so only one chunk of rows is ever held in
+    memory. The second column is skipped, the same way the batch path uses it as
+    the index (index_col=1) and never writes it out.
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        width = len(columns)
+
+        buffer = []
+        for row in rows:
+            # Skip blank rows like read_excel does
+            if all(value is None for value in row):
+                continue
+            # read_only rows can be shorter than the header when trailing cells are empty
+            buffer.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(buffer) >= chunk_size:
+                yield _to_chunk(buffer, columns)
+                buffer = []
+
+        if buffer:
+            yield _to_chunk(buffer, columns)
+    finally:
+        workbook.close()
+
+
+def _to_chunk(rows, columns):
+    chunk = pd.DataFrame.from_records(rows, columns=columns)
+    chunk = chunk.drop(columns=chunk.columns[1])
+    return normalize_upload(chunk)
+
+
+def is_delimited(file_path):
+    """True for CSV/TSV exports (by file extension)."""
+    return os.path.splitext(file_path)[1].lower() in DELIMITED_SUFFIXES
+
+
+def sniff_delimiter(header_line, default=","):
+    """The separator used by a header line: whichever of , ; tab | occurs most."""
+    counts = {sep: header_line.count(sep) for sep in (",", ";", "\t", "|")}
+    sep = max(counts, key=counts.get)
+    return sep if counts[sep] else default
+
+
+def iter_delimited_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream a CSV/TSV export as normalized DataFrame chunks, each paired with its
+    count of coerced document cells.
+
+    The document and text grouping columns are read as strings and the numeric
+    grouping columns as integers, so no column type is guessed per chunk. As
+    for workbooks, the second column (NAMA) is skipped.
+    """
+    with open(file_path, encoding="utf-8-sig", newline="") as f:
+        header_line = f.readline()
+    sep = sniff_delimiter(header_line, DELIMITED_SUFFIXES.get(os.path.splitext(file_path)[1].lower(), ","))
+    header = next(csv.reader([header_line], delimiter=sep), [])
+
+    dtype = {}
+    for raw_name in header:
+        name = raw_name.strip().upper()
+        if name in numeric_group_cols:
+            dtype[raw_name] = "Int64"
+        elif name in doc_columns or name in group_cols:
+            dtype[raw_name] = str
+
+    reader = pd.read_csv(file_path, sep=sep, encoding="utf-8-sig", dtype=dtype, chunksize=chunk_size,
+                         # Only empty cells are missing; "NA" and the like stay text
+                         keep_default_na=False, na_values=[""], skip_blank_lines=True)
+    for chunk in reader:
+        chunk = chunk.drop(columns=chunk.columns[1])
+        chunk, coerced = normalize_upload(chunk)
+        for col in numeric_group_cols:
+            if col in chunk.columns:
+                # Empty cells were filled with 0, so the column has no missing values left
+                chunk[col] = chunk[col].astype(np.int64)
+        yield chunk, coerced
+
+
+def expand_inputs(paths):
+    """Workbook files for --inputs: files as given, directories expanded to their *.xlsx (sorted)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                name for name in glob.glob(os.path.join(path, "*.xlsx"))
+                # Skip Excel's lock files of open workbooks
+                if not os.path.basename(name).startswith("~$")
+            ))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            raise FileNotFoundError(path)
+    return files
+
+
+def read_workbook_parts(file_path):
+    """
+    Read every sheet of one workbook (worker process of `iter_workbook_parts`).
+
+    Each non-empty sheet is normalized like a single upload and pre-aggregated
+    into its own CellAccumulator; returns (sheet frame, coerced cells, partial
+    cells) per sheet.
+    """
+    parts = []
+    for df in read_excel(file_path, sheet_name=None, index_col=1).values():
+        if df.empty:
+            continue
+        df, coerced = normalize_upload(df)
+        cells = CellAccumulator(doc_columns, group_cols)
+        cells.add(df)
+        parts.append((df, coerced, cells))
+    return parts
+
+
+def iter_workbook_parts(file_paths, workers=None):
+    """
+    Parse many workbooks in a process pool, yielding their sheets in input order.
+
+    Parsing, normalizing and the first aggregation run in the workers; the
+    caller only merges the partial cells. Uses fork so the workers do not
+    re-run the calling script; without fork the workbooks are read one by one.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(file_paths))
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for file_path in file_paths:
+            yield from read_workbook_parts(file_path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        for parts in pool.map(read_workbook_parts, file_paths):
+            yield from parts
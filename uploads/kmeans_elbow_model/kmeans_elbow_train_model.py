@@ -3,9 +3,60 @@
 # ==============================
 
 # Standard Library Imports (for file handling and script management)
+import argparse
 import os
 import sys
 
+# Shared pipeline modules (one level up, in uploads/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fingerprint import code_version, is_up_to_date, record_run, run_key  # Skip unchanged re-runs
+from snapshot_meta import snapshot_data_hash  # Version of the prepared data, read with NumPy only
+
+
+# ==============================
+# COMMAND-LINE OPTIONS
+# ==============================
+
+parser = argparse.ArgumentParser(description="Train the K-Means elbow model on data_ready.xlsx.")
+parser.add_argument("--warm-start", action="store_true",
+                    help="Fit the best K from the centers of the saved kmeans_model_elbow.pkl (mapped through the "
+                         "scaler saved with it) when it has the same number of clusters")
+args = parser.parse_args()
+
+
+# ==============================
+# SKIP UNCHANGED RE-RUNS
+# ==============================
+
+# Checked before the imports below (pandas, matplotlib, scikit-learn), so an
+# unchanged re-run reports the stored results without loading them
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
+
+# Skip retraining when neither the data nor the code changed since the last run
+fingerprint_file = os.path.join(script_dir, "kmeans_elbow_fingerprint.json")
+model_outputs = [os.path.join(script_dir, name) for name in [
+    "kmeans_elbow_html_results.txt",
+    "kmeans_elbow_output.csv",
+    "kmeans_elbow_metrics.csv",
+    "kmeans_model_elbow.pkl",
+    "kmeans_model_elbow_scaler.pkl",
+    "kmeans_elbow_lookup.npz",
+    "kmeans_elbow_clusters.png",
+    "kmeans_elbow_pca.png",
+    "kmeans_elbow_fit_time.png",
+]]
+training_key = run_key(snapshot_data_hash(file_path), code_version(__file__), args.warm_start)
+if is_up_to_date(fingerprint_file, training_key, model_outputs):
+    print("Data unchanged since the last run; reusing the existing K-Means Elbow results")
+    sys.exit(0)
+
+
+# ==============================
+# TRAINING IMPORTS
+# ==============================
+
 # Third-Party Library Imports (external dependencies)
 import joblib  # For saving and loading models
 import pandas as pd  # Data manipulation library
@@ -16,11 +67,8 @@ from scipy.spatial.distance import cdist
 from yellowbrick.cluster import KElbowVisualizer
 
 # Machine Learning & Preprocessing Imports
-from sklearn.decomposition import PCA
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from matplotlib.colors import ListedColormap
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
 from sklearn.cluster import KMeans  # K-Means clustering algorithm
 # from sklearn.metrics import (
 #     confusion_matrix,
@@ -28,6 +76,15 @@ from sklearn.cluster import KMeans  # K-Means clustering algorithm
 #     ConfusionMatrixDisplay
 # )
 
+# Shared pipeline modules
+from data_snapshot import load_data_ready, load_doc_mask  # Fast typed snapshot of data_ready.xlsx
+from doc_mask import present_counts  # Popcount of the packed document flags
+from feature_store import load_features, load_projection  # Scaled features and 2-D PCA shared by all trainers
+from evaluation import pattern_scores  # Silhouette/CH/DB from weighted document patterns
+from lookup import build_lookup, write_lookup  # Mask -> cluster table of the model
+from patterns import pattern_histogram  # Unique document patterns
+from warm_start import load_warm_start, scaler_path_for  # Seed the refit with the saved centers
+
 # kmeans_html_content = """
 # <!DOCTYPE html>
 # <html lang="en">
@@ -63,11 +120,9 @@ def df_to_datatable_html(df, title, table_id, index):
 # LOAD DATA
 # ==============================
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
-
 try:
-    df = pd.read_excel(file_path, index_col=0)
+    df = load_data_ready(file_path, compact=True)  # Categorical/int8 columns instead of object/int64
+    doc_mask = load_doc_mask(file_path)  # None when data_ready has no packed mask
 except FileNotFoundError:
     print(f"Error: File not found at {file_path}")
     sys.exit(1)
@@ -85,8 +140,8 @@ doc_columns = [
     "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
 ]
 
-df_kmeans = df.copy()
-df_kmeans.loc[:, 'Completeness_Percentage'] = (df_kmeans[doc_columns].sum(axis=1) / len(doc_columns)) * 100
+df_kmeans = df  # No defensive copy: df is not used on its own again
+df_kmeans.loc[:, 'Completeness_Percentage'] = (present_counts(df_kmeans, doc_columns, doc_mask) / len(doc_columns)) * 100
 weight_factor = 5
 df_kmeans['Weighted_Completeness'] = df_kmeans['Completeness_Percentage'] * weight_factor
 df_kmeans_for_clustering = df_kmeans[doc_columns + ['Weighted_Completeness']]
@@ -95,8 +150,11 @@ df_kmeans_for_clustering = df_kmeans[doc_columns + ['Weighted_Completeness']]
 # DATA SCALING
 # ==============================
 
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_kmeans_for_clustering)
+# Fitted once per data version and shared by all trainers (memory-mapped, read-only)
+X_scaled, scaler = load_features(file_path, df_kmeans_for_clustering)
+
+# Unique document patterns with their row counts, for the cluster metrics
+patterns = pattern_histogram(X_scaled, doc_mask)
 
 # ==============================
 # ELBOW METHOD TO FIND BEST K (Inertia)
@@ -132,17 +190,36 @@ plt.close(fig)
 # KMEANS WITH BEST K
 # ==============================
 
-kmeans = KMeans(n_clusters=best_k, random_state=42)
-df_kmeans.loc[:, 'Cluster'] = kmeans.fit_predict(X_scaled)
 model_output = os.path.join(script_dir, "kmeans_model_elbow.pkl")
+init = load_warm_start(model_output, scaler, n_clusters=best_k) if args.warm_start else None
+if init is not None:
+    # Last run's centers, refined with a single initialization
+    kmeans = KMeans(n_clusters=best_k, init=init, n_init=1, random_state=42)
+else:
+    if args.warm_start:
+        print(f"No saved K-Means elbow model with {best_k} clusters to warm-start from; fitting from scratch")
+    kmeans = KMeans(n_clusters=best_k, random_state=42)
+df_kmeans.loc[:, 'Cluster'] = kmeans.fit_predict(X_scaled)
+print(f"K-Means converged in {kmeans.n_iter_} iteration(s){' (warm start)' if init is not None else ''}")
+
+# Save the model, and the scaler its centers are expressed in for the next warm start
 joblib.dump(kmeans, model_output)
+joblib.dump(scaler, scaler_path_for(model_output))
 
 # ==============================
 # CLUSTER LABELS AS "CLUSTER 1", "CLUSTER 2", ...
 # ==============================
 
-df_kmeans['Cluster_Label'] = df_kmeans['Cluster'].apply(lambda x: f"Cluster {x+1}")
 cluster_labels = [f"Cluster {i+1}" for i in range(best_k)]
+# Categorical labels: cluster i is code i, so no string is built per row
+df_kmeans['Cluster_Label'] = pd.Categorical.from_codes(df_kmeans['Cluster'], cluster_labels)
+
+# Tabulate the model over every document mask, so new rows can be assigned a
+# cluster and label by indexing the table with their mask (see lookup.py)
+lookup_output = os.path.join(script_dir, "kmeans_elbow_lookup.npz")
+write_lookup(lookup_output, build_lookup(kmeans, scaler, len(doc_columns), weight_factor),
+             cluster_labels, doc_columns,
+             model="kmeans_model_elbow.pkl", weight_factor=weight_factor, data_sha256=snapshot_data_hash(file_path))
 
 # ==============================
 # EXPORT CLUSTERED DATA
@@ -175,9 +252,8 @@ plt.close()
 # CLUSTERING METRICS
 # ==============================
 
-silhouette = silhouette_score(X_scaled, df_kmeans['Cluster'])
-calinski_harabasz = calinski_harabasz_score(X_scaled, df_kmeans['Cluster'])
-davies_bouldin = davies_bouldin_score(X_scaled, df_kmeans['Cluster'])
+# Exact scores of the rows, computed between the distinct (pattern, cluster) pairs weighted by their counts
+silhouette, calinski_harabasz, davies_bouldin = pattern_scores(patterns, df_kmeans['Cluster'])
 
 metrics_dict = {
     "Metric": ["Silhouette Score", "Calinski-Harabasz Index", "Davies-Bouldin Index"],
@@ -192,8 +268,8 @@ kmeans_html_content += df_to_datatable_html(metrics_df, "K-Means Elbow Metrics",
 # PCA VISUALIZATION
 # ==============================
 
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
+# Fitted once per data version and shared by all trainers; only the labels and centroids are ours
+X_pca, pca = load_projection(X_scaled)
 custom_cmap = ListedColormap(matplotlib.colormaps['tab10'].colors[:best_k])
 plt.figure(figsize=(10, 8))
 scatter = plt.scatter(X_pca[:, 0], X_pca[:, 1], c=df_kmeans['Cluster'], cmap=custom_cmap, edgecolors='k', s=50)
@@ -216,7 +292,7 @@ plt.close()
 # ==============================
 
 def group_and_report(df, group_col, report_name):
-    cluster_count = df.groupby(group_col)['Cluster_Label'].value_counts().unstack(fill_value=0)
+    cluster_count = df.groupby(group_col, observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
     cluster_count = cluster_count.reindex(columns=cluster_labels, fill_value=0)
     cluster_count['Total'] = cluster_count[cluster_labels].sum(axis=1)
     # Assign weights: Cluster 1 = best, Cluster 2 = next, etc.
@@ -249,6 +325,9 @@ with open(html_log_file, "w", encoding="utf-8") as f:
 
 print(f"All DataFrames saved as HTML in: {html_log_file}")
 
+# Remember the inputs of this run so an unchanged re-run can be skipped
+record_run(fingerprint_file, training_key, model_outputs)
+
 # ==============================
 # (OPTIONAL) CLASSIFY DOCUMENT COMPLETENESS (GROUND TRUTH) FOR EVALUATION
 # ==============================
@@ -3,27 +3,89 @@
 # ==============================
 
 # Standard Library Imports (for file handling and script management)
+import argparse
 import os
 import sys
 
+# Shared pipeline modules (one level up, in uploads/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fingerprint import code_version, is_up_to_date, record_run, run_key  # Skip unchanged re-runs
+from snapshot_meta import snapshot_data_hash  # Version of the prepared data, read with NumPy only
+
+
+# ==============================
+# COMMAND-LINE OPTIONS
+# ==============================
+
+parser = argparse.ArgumentParser(description="Train the K-Means model on data_ready.xlsx.")
+parser.add_argument("--minibatch", choices=["auto", "on", "off"], default="auto",
+                    help="Fit MiniBatchKMeans on batches streamed from the feature store instead of the "
+                         "document patterns. 'auto' (default) does so from MINIBATCH_THRESHOLD_ROWS "
+                         "(minibatch.py, 1,000,000) rows on")
+parser.add_argument("--warm-start", action="store_true",
+                    help="Start from the centers of the saved kmeans_model.pkl (mapped through the scaler saved "
+                         "with it) with a single initialization, instead of a fresh k-means++ seeding")
+args = parser.parse_args()
+
+
+# ==============================
+# SKIP UNCHANGED RE-RUNS
+# ==============================
+
+# Checked before the imports below (pandas, matplotlib, scikit-learn), so an
+# unchanged re-run reports the stored results without loading them
+
+# Get the script's directory and define the data file path (one level up)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
+
+# Skip retraining when neither the data nor the code changed since the last run
+fingerprint_file = os.path.join(script_dir, "kmeans_fingerprint.json")
+model_outputs = [os.path.join(script_dir, name) for name in [
+    "kmeans_html_results.txt",
+    "kmeans_output.csv",
+    "kmeans_metrics.csv",
+    "kmeans_model.pkl",
+    "kmeans_model_scaler.pkl",
+    "kmeans_lookup.npz",
+    "kmeans_clusters.png",
+    "kmeans_pca.png",
+    "kmeans_confusion_matrix.png",
+]]
+training_key = run_key(snapshot_data_hash(file_path), code_version(__file__), args.minibatch, args.warm_start)
+if is_up_to_date(fingerprint_file, training_key, model_outputs):
+    print("Data unchanged since the last run; reusing the existing K-Means results")
+    sys.exit(0)
+
+
+# ==============================
+# TRAINING IMPORTS
+# ==============================
+
 # Third-Party Library Imports (external dependencies)
 import joblib  # For saving and loading models
 import pandas as pd  # Data manipulation library
 import matplotlib.pyplot as plt  # Data visualization
 
 # Machine Learning & Preprocessing Imports
-from sklearn.decomposition import PCA
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from matplotlib.colors import ListedColormap
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
-from sklearn.cluster import KMeans  # K-Means clustering algorithm
 from sklearn.metrics import (
     confusion_matrix,
     classification_report,
     ConfusionMatrixDisplay
 )
 
+# Shared pipeline modules
+from data_snapshot import load_data_ready, load_doc_mask  # Fast typed snapshot of data_ready.xlsx
+from doc_mask import present_counts  # Popcount of the packed document flags
+from feature_store import load_features, load_projection  # Scaled features and 2-D PCA shared by all trainers
+from evaluation import pattern_scores, streamed_scores  # Silhouette/CH/DB from weighted document patterns or batches
+from lookup import build_lookup, write_lookup  # Mask -> cluster table of the model
+from minibatch import MINIBATCH_THRESHOLD_ROWS, fit_minibatch_kmeans  # Streamed fit for very large uploads
+from patterns import fit_pattern_kmeans, pattern_histogram  # Fit on unique document patterns
+from warm_start import load_warm_start, scaler_path_for  # Seed the refit with the saved centers
+
 
 
 # kmeans_html_content = """
@@ -64,13 +126,10 @@ def df_to_datatable_html(df, title, table_id, index):
 # LOAD DATA
 # ==============================
 
-# Get the script's directory and define the data file path (one level up)
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir, "..", "data_ready.xlsx")
-
 # Try to load the Excel file; exit script if an error occurs
 try:
-    df = pd.read_excel(file_path, index_col=0)
+    df = load_data_ready(file_path, compact=True)  # Categorical/int8 columns instead of object/int64
+    doc_mask = load_doc_mask(file_path)  # None when data_ready has no packed mask
 except FileNotFoundError:
     print(f"Error: File not found at {file_path}")
     sys.exit(1)  # Exit script if file is missing
@@ -90,11 +149,12 @@ doc_columns = [
     "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
 ]
 
-# Create a copy of the dataframe to avoid modifying original data
-df_kmeans = df.copy()
+# Work on the loaded frame itself: df is not used on its own again and a
+# full copy would double the working set
+df_kmeans = df
 
 # Compute the completeness percentage for each row (how many required documents are present)
-df_kmeans.loc[:, 'Completeness_Percentage'] = (df_kmeans[doc_columns].sum(axis=1) / len(doc_columns)) * 100
+df_kmeans.loc[:, 'Completeness_Percentage'] = (present_counts(df_kmeans, doc_columns, doc_mask) / len(doc_columns)) * 100
 
 # Apply a weighting factor to emphasize document completeness in clustering
 weight_factor = 5  
@@ -108,16 +168,31 @@ df_kmeans_for_clustering = df_kmeans[doc_columns + ['Weighted_Completeness']]
 # ==============================
 
 # Normalize feature values to improve clustering performance
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_kmeans_for_clustering)
-
-# Perform K-Means clustering with 3 clusters
-kmeans = KMeans(n_clusters=3, random_state=42)
-df_kmeans.loc[:, 'Cluster'] = kmeans.fit_predict(X_scaled)  
-
-# Save the trained K-Means model
+# Fitted once per data version and shared by all trainers (memory-mapped, read-only)
+X_scaled, scaler = load_features(file_path, df_kmeans_for_clustering)
+
+# Perform K-Means clustering with 3 clusters on the unique document patterns,
+# weighted by their row counts: the same clusters as KMeans(n_clusters=3,
+# random_state=42) on every row, in a fit time that no longer grows with the rows.
+# Very large uploads are fitted with mini-batches streamed from the feature store
+# instead, so neither the fit nor the scores hold more than a few batches of rows
 model_output = os.path.join(script_dir, "kmeans_model.pkl")
+init = load_warm_start(model_output, scaler, n_clusters=3) if args.warm_start else None
+if args.warm_start and init is None:
+    print("No saved K-Means model with 3 clusters to warm-start from; fitting from scratch")
+use_minibatch = args.minibatch == "on" or (args.minibatch == "auto" and len(X_scaled) >= MINIBATCH_THRESHOLD_ROWS)
+if use_minibatch:
+    kmeans, row_labels = fit_minibatch_kmeans(X_scaled, n_clusters=3, random_state=42, init=init)
+else:
+    # Only this path collapses the rows; without a mask that means a sorted copy of the matrix
+    patterns = pattern_histogram(X_scaled, doc_mask)
+    kmeans, row_labels = fit_pattern_kmeans(patterns, n_clusters=3, random_state=42, init=init)
+df_kmeans.loc[:, 'Cluster'] = row_labels
+print(f"K-Means converged in {kmeans.n_iter_} iteration(s){' (warm start)' if init is not None else ''}")
+
+# Save the trained K-Means model, and the scaler its centers are expressed in for the next warm start
 joblib.dump(kmeans, model_output)
+joblib.dump(scaler, scaler_path_for(model_output))
 
 # ==============================
 # ASSIGN CLUSTER LABELS
@@ -129,9 +204,19 @@ cluster_medians = df_kmeans.groupby('Cluster')['Completeness_Percentage'].median
 # Sort clusters based on completeness levels
 sorted_clusters = cluster_medians.sort_values()
 
+# Labels as a categorical (one small code per row instead of a Python string)
+label_dtype = pd.CategoricalDtype(['Low', 'Medium', 'High'])
+
 # Map cluster indexes to labels ('Low', 'Medium', 'High') based on completeness level
 cluster_mapping = {sorted_clusters.index[0]: 'Low', sorted_clusters.index[1]: 'Medium', sorted_clusters.index[2]: 'High'}
-df_kmeans['Cluster_Label'] = df_kmeans['Cluster'].map(cluster_mapping)
+df_kmeans['Cluster_Label'] = df_kmeans['Cluster'].map(cluster_mapping).astype(label_dtype)
+
+# Tabulate the model over every document mask, so new rows can be assigned a
+# cluster and label by indexing the table with their mask (see lookup.py)
+lookup_output = os.path.join(script_dir, "kmeans_lookup.npz")
+write_lookup(lookup_output, build_lookup(kmeans, scaler, len(doc_columns), weight_factor),
+             [cluster_mapping[cluster] for cluster in range(len(cluster_mapping))], doc_columns,
+             model="kmeans_model.pkl", weight_factor=weight_factor, data_sha256=snapshot_data_hash(file_path))
 
 # ==============================
 # EXPORT CLUSTERED DATA
@@ -192,18 +277,23 @@ def classify_completeness(percentage):
         return 'Low'
 
 # Apply classification function to assign ground truth labels
-df_kmeans['Actual_Label'] = df_kmeans['Completeness_Percentage'].apply(classify_completeness)
+# Same rule as classify_completeness, applied to the whole column at once
+df_kmeans['Actual_Label'] = pd.cut(df_kmeans['Completeness_Percentage'], bins=[-np.inf, medium_threshold, high_threshold, np.inf],
+                                 labels=label_dtype.categories, ordered=False).astype(label_dtype)
 
 # Compute accuracy by comparing predicted clusters with actual labels
 correct_predictions = (df_kmeans['Actual_Label'] == df_kmeans['Cluster_Label']).sum()
-df_kmeans['Cluster_Label'] = df_kmeans['Cluster'].map(cluster_mapping)
+df_kmeans['Cluster_Label'] = df_kmeans['Cluster'].map(cluster_mapping).astype(label_dtype)
 
 
 # Compute metrics
 accuracy = correct_predictions / len(df_kmeans)
-silhouette = silhouette_score(X_scaled, df_kmeans['Cluster'])
-calinski_harabasz = calinski_harabasz_score(X_scaled, df_kmeans['Cluster'])
-davies_bouldin = davies_bouldin_score(X_scaled, df_kmeans['Cluster'])
+# Exact scores of the rows, computed between the distinct (pattern, cluster) pairs weighted by their counts
+if use_minibatch:
+    # Streamed from the feature store like the fit: exact CH/DB, silhouette of a row sample
+    silhouette, calinski_harabasz, davies_bouldin = streamed_scores(X_scaled, df_kmeans['Cluster'].to_numpy())
+else:
+    silhouette, calinski_harabasz, davies_bouldin = pattern_scores(patterns, df_kmeans['Cluster'])
 
 # Store results in a dictionary
 metrics_dict = {
@@ -284,8 +374,8 @@ kmeans_html_content += df_to_datatable_html(report_df, "K-Means Classification R
 # ================================
 
 # Apply PCA for dimensionality reduction (reduce to 2D)
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
+# Fitted once per data version and shared by all trainers; only the labels and centroids are ours
+X_pca, pca = load_projection(X_scaled)
 
 # Define custom colors for clusters
 custom_cmap = ListedColormap(['blue', 'orange', 'green'])
@@ -341,7 +431,7 @@ plt.close()
 # =============================================
 
 # Group by 'UNIT KERJA' and get the counts of each cluster label
-cluster_count_per_unit = df_kmeans.groupby('UNIT KERJA')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_unit = df_kmeans.groupby('UNIT KERJA', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_unit = cluster_count_per_unit[['High', 'Medium', 'Low']]
@@ -377,7 +467,7 @@ kmeans_html_content += df_to_datatable_html(cluster_count_per_unit_sorted, "K-Me
 # =============================================
 
 # Group by 'TINGKAT' and get the counts of each cluster label
-cluster_count_per_tingkat = df_kmeans.groupby('TINGKAT')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_tingkat = df_kmeans.groupby('TINGKAT', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_tingkat = cluster_count_per_tingkat[['High', 'Medium', 'Low']]
@@ -416,7 +506,7 @@ kmeans_html_content += df_to_datatable_html(cluster_count_per_tingkat_sorted, "K
 
 
 # Group by 'LOKASI' and get the counts of each cluster label
-cluster_count_per_lokasi = df_kmeans.groupby('LOKASI')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_lokasi = df_kmeans.groupby('LOKASI', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_lokasi = cluster_count_per_lokasi[['High', 'Medium', 'Low']]
@@ -453,7 +543,7 @@ kmeans_html_content += df_to_datatable_html(cluster_count_per_lokasi_sorted, "K-
 
 
 # Group by 'PROVINSI' and get the counts of each cluster label
-cluster_count_per_provinsi = df_kmeans.groupby('PROVINSI')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_provinsi = df_kmeans.groupby('PROVINSI', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_provinsi = cluster_count_per_provinsi[['High', 'Medium', 'Low']]
@@ -490,7 +580,7 @@ kmeans_html_content += df_to_datatable_html(cluster_count_per_provinsi_sorted, "
 
 
 # Group by 'STATUS' and get the counts of each cluster label
-cluster_count_per_status = df_kmeans.groupby('STATUS')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_status = df_kmeans.groupby('STATUS', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_status = cluster_count_per_status[['High', 'Medium', 'Low']]
@@ -529,7 +619,7 @@ kmeans_html_content += df_to_datatable_html(cluster_count_per_status_sorted, "K-
 # ===================================================
 
 # Group by 'JENIS KELAMIN' and get the counts of each cluster label
-cluster_count_per_jk = df_kmeans.groupby('JENIS KELAMIN')['Cluster_Label'].value_counts().unstack(fill_value=0)
+cluster_count_per_jk = df_kmeans.groupby('JENIS KELAMIN', observed=True)['Cluster_Label'].value_counts().unstack(fill_value=0)
 
 # Reorder the columns to match 'High', 'Medium', 'Low'
 cluster_count_per_jk = cluster_count_per_jk[['High', 'Medium', 'Low']]
@@ -573,3 +663,6 @@ with open(html_log_file, "w", encoding="utf-8") as f:
     f.write(kmeans_html_content)
 
 print(f"All DataFrames saved as HTML in: {html_log_file}")
+
+# Remember the inputs of this run so an unchanged re-run can be skipped
+record_run(fingerprint_file, training_key, model_outputs)
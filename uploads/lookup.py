@@ -0,0 +1,56 @@
+# ==============================
+# MASK -> CLUSTER LOOKUP TABLES
+# ==============================
+
+# A row's features (the document flags plus Weighted_Completeness) follow from
+# its packed document mask alone, so a fitted model can be evaluated once for
+# every possible mask. The trainers save that table next to their model, e.g.
+#
+#   kmeans_model/kmeans_lookup.npz   cluster of each of the 4096 masks + label names
+#
+# and assigning clusters to new rows is then one array index per row: no
+# scaler, no sklearn and no distance computation.
+
+import numpy as np
+
+from snapshot_meta import read_npz_meta, save_npz
+from doc_mask import popcount, unpack_doc_mask
+
+LOOKUP_VERSION = 1
+
+
+def mask_features(n_docs, weight_factor):
+    """Unscaled feature rows of all 2**n_docs masks, computed like the trainers compute them."""
+    masks = np.arange(1 << n_docs)
+    weighted_completeness = (popcount(masks) / n_docs) * 100 * weight_factor
+    return np.column_stack([unpack_doc_mask(masks, n_docs), weighted_completeness])
+
+
+def build_lookup(model, scaler, n_docs, weight_factor):
+    """The cluster `model` predicts for every mask, from features scaled with `scaler`."""
+    features = mask_features(n_docs, weight_factor)
+    if hasattr(scaler, "feature_names_in_"):
+        # The scaler was fitted on a frame; give it the same column names
+        import pandas as pd
+        features = pd.DataFrame(features, columns=scaler.feature_names_in_)
+    return model.predict(scaler.transform(features)).astype(np.uint8)
+
+
+def write_lookup(file_path, clusters, label_names, doc_columns, **meta):
+    """Save a lookup table: the cluster of every mask and the label of every cluster."""
+    save_npz(file_path, {"cluster": np.asarray(clusters, dtype=np.uint8),
+                         "label_names": np.asarray(label_names, dtype=str)},
+             {"version": LOOKUP_VERSION, "doc_columns": list(doc_columns), **meta})
+
+
+def load_lookup(file_path):
+    """Return (clusters, label_names, meta) of a saved lookup table."""
+    with np.load(file_path, allow_pickle=False) as data:
+        return data["cluster"], data["label_names"], read_npz_meta(data)
+
+
+def assign_clusters(file_path, doc_mask):
+    """Cluster codes and labels of rows given by their document masks, from a saved lookup table."""
+    clusters, label_names, _ = load_lookup(file_path)
+    row_clusters = clusters[np.asarray(doc_mask)]
+    return row_clusters, label_names[row_clusters]
@@ -0,0 +1,54 @@
+# ==============================
+# STREAMED MINI-BATCH K-MEANS
+# ==============================
+
+# K-Means for uploads whose feature matrix should not be processed whole:
+# MiniBatchKMeans is trained with partial_fit on batches read from the
+# memory-mapped feature store, and the labels are assigned in a second pass
+# over the same batches. Memory stays at a few batches of rows plus the labels.
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.utils import check_random_state
+
+# From this many rows on, the K-Means trainer switches to the streamed
+# mini-batch fit (--minibatch auto)
+MINIBATCH_THRESHOLD_ROWS = 1_000_000
+STREAM_BATCH_ROWS = 50_000
+MAX_EPOCHS = 10
+
+
+def row_batches(n_rows, batch_rows=STREAM_BATCH_ROWS):
+    """Contiguous slices covering n_rows, so each batch is one sequential read of the memory map."""
+    return [slice(start, start + batch_rows) for start in range(0, n_rows, batch_rows)]
+
+
+def fit_minibatch_kmeans(X_scaled, n_clusters, random_state=None, batch_rows=STREAM_BATCH_ROWS,
+                         max_epochs=MAX_EPOCHS, tol=1e-4, init=None):
+    """
+    Fit MiniBatchKMeans on X_scaled batch by batch; returns (kmeans, row labels).
+
+    Each epoch visits the batches in a random order (the rows of an upload are
+    grouped by unit, so a fixed order would bias the centers), and training
+    stops once an epoch moves no center by more than `tol`. An `init` array
+    of centers replaces the k-means++ seeding on the first batch; n_iter_ is
+    set to the number of epochs run.
+    """
+    random_state = check_random_state(random_state)
+    batches = row_batches(len(X_scaled), batch_rows)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_rows, random_state=random_state,
+                             **({} if init is None else {"init": init, "n_init": 1}))
+
+    for epoch in range(max_epochs):
+        previous_centers = getattr(kmeans, "cluster_centers_", None)
+        previous_centers = None if previous_centers is None else previous_centers.copy()
+        for batch in random_state.permutation(len(batches)):
+            kmeans.partial_fit(np.asarray(X_scaled[batches[batch]]))
+        if previous_centers is not None and np.abs(kmeans.cluster_centers_ - previous_centers).max() <= tol:
+            break
+    kmeans.n_iter_ = epoch + 1
+
+    labels = np.empty(len(X_scaled), dtype=np.int32)
+    for batch in batches:
+        labels[batch] = kmeans.predict(np.asarray(X_scaled[batch]))
+    return kmeans, labels
@@ -0,0 +1,445 @@
+# ==============================
+# DOCUMENT PATTERN HISTOGRAMS
+# ==============================
+
+# A row of the scaled feature matrix depends only on which of the 12 documents
+# are present (Weighted_Completeness is a function of them), so at most 4096
+# distinct rows exist however large the upload is. The models are fitted on
+# those unique patterns, weighted by how many rows share each one, and the
+# labels are broadcast back to the rows through the pattern id.
+#
+# Only public scikit-learn API is used: the pieces of the weighted fits that
+# sklearn keeps private (the Ward tree cut, the Gaussian M-step) are written
+# out here, and tests/test_patterns.py checks them against sklearn on the rows.
+
+import warnings
+from heapq import heappush, heappushpop
+
+import numpy as np
+from scipy import linalg
+from scipy.spatial.distance import pdist, squareform
+from sklearn.cluster import KMeans
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.metrics.pairwise import euclidean_distances
+from sklearn.mixture import GaussianMixture
+from sklearn.utils import check_random_state
+
+
+def pattern_histogram(X_scaled, doc_mask=None):
+    """
+    Collapse the rows of X_scaled to their unique patterns.
+
+    Returns (X_patterns, counts, inverse): one row per pattern, the number of
+    rows with that pattern and the pattern id of every row. The packed document
+    mask gives the pattern ids directly; without it (document columns that are
+    not 0/1) the rows themselves are compared.
+    """
+    if doc_mask is not None:
+        _, first, inverse, counts = np.unique(doc_mask, return_index=True, return_inverse=True, return_counts=True)
+        return np.asarray(X_scaled[first]), counts, inverse.ravel()
+    X_patterns, inverse, counts = np.unique(np.asarray(X_scaled), axis=0, return_inverse=True, return_counts=True)
+    return X_patterns, counts, inverse.ravel()
+
+
+def row_mean_variance(X_patterns, counts):
+    """Mean over the features of the per-row variance, computed from the patterns."""
+    mean = np.average(X_patterns, axis=0, weights=counts)
+    return np.mean(np.average((X_patterns - mean) ** 2, axis=0, weights=counts))
+
+
+def _scaled_tol(X_patterns, counts, tol):
+    # KMeans scales tol by the data variance; use the variance of the rows, not of the patterns
+    pattern_variance = np.mean(np.var(X_patterns, axis=0))
+    return tol * row_mean_variance(X_patterns, counts) / pattern_variance if pattern_variance > 0 else tol
+
+
+def _row_kmeans_plusplus(X_patterns, counts, inverse, n_clusters, random_state):
+    """
+    The k-means++ seeding KMeans draws on the full rows, with the distances computed per pattern.
+
+    Mirrors sklearn's _kmeans_plusplus step by step: the random draws are made
+    over the rows in their original order (so they pick the same rows), while
+    every distance is computed once per pattern and gathered for its rows.
+    """
+    n_rows = len(inverse)
+    # KMeans centers the data on the row mean before seeding
+    row_mean = np.average(X_patterns, axis=0, weights=counts)
+    X = X_patterns - row_mean
+    x_squared_norms = np.einsum("ij,ij->i", X, X)
+    sample_weight = np.ones(n_rows, dtype=X.dtype)
+    n_local_trials = 2 + int(np.log(n_clusters))
+
+    centers = np.empty((n_clusters, X.shape[1]), dtype=X.dtype)
+    center_id = inverse[random_state.choice(n_rows, p=sample_weight / sample_weight.sum())]
+    centers[0] = X[center_id]
+
+    closest_dist_sq = euclidean_distances(centers[0, np.newaxis], X, Y_norm_squared=x_squared_norms, squared=True)
+    current_pot = closest_dist_sq[:, inverse] @ sample_weight
+
+    for c in range(1, n_clusters):
+        rand_vals = random_state.uniform(size=n_local_trials) * current_pot
+        candidate_ids = np.searchsorted(np.cumsum(sample_weight * closest_dist_sq[0, inverse], dtype=np.float64),
+                                        rand_vals)
+        np.clip(candidate_ids, None, n_rows - 1, out=candidate_ids)
+        candidate_ids = inverse[candidate_ids]
+
+        distance_to_candidates = euclidean_distances(X[candidate_ids], X, Y_norm_squared=x_squared_norms, squared=True)
+        np.minimum(closest_dist_sq, distance_to_candidates, out=distance_to_candidates)
+        candidates_pot = distance_to_candidates[:, inverse] @ sample_weight.reshape(-1, 1)
+
+        best_candidate = np.argmin(candidates_pot)
+        current_pot = candidates_pot[best_candidate]
+        closest_dist_sq = distance_to_candidates[best_candidate, np.newaxis]
+        centers[c] = X[candidate_ids[best_candidate]]
+
+    return centers + row_mean
+
+
+def fit_pattern_kmeans(patterns, n_clusters, random_state=None, tol=1e-4, max_iter=300, init=None):
+    """
+    Fit KMeans on a pattern histogram; returns (kmeans, row labels).
+
+    Gives the clustering of KMeans(n_clusters, random_state=random_state) on
+    all rows: same seeding, same convergence tolerance and same cluster
+    numbering, with every Lloyd iteration done on the weighted patterns. Only a
+    point exactly equidistant from two centers can end up on the other side,
+    as the sums behind the centers are rounded differently. An `init` array of
+    centers (e.g. a warm start) replaces the k-means++ seeding. With fewer
+    patterns than clusters, KMeans is fitted on the rows themselves.
+    """
+    X_patterns, counts, inverse = patterns
+    if n_clusters > len(X_patterns):
+        # Some clusters can only be made by splitting identical rows, which needs the rows
+        kmeans = KMeans(n_clusters=n_clusters, init="k-means++" if init is None else init, n_init=1,
+                        tol=tol, max_iter=max_iter, random_state=random_state)
+        return kmeans, kmeans.fit_predict(X_patterns[inverse])
+    if init is None:
+        init = _row_kmeans_plusplus(X_patterns, counts, inverse, n_clusters, check_random_state(random_state))
+    kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=1, tol=_scaled_tol(X_patterns, counts, tol),
+                    max_iter=max_iter, random_state=random_state)
+    kmeans.fit(X_patterns, sample_weight=counts)
+    return kmeans, kmeans.labels_[inverse]
+
+
+class WeightedGaussianMixture(GaussianMixture):
+    """
+    GaussianMixture whose EM takes per-sample weights, e.g. pattern counts.
+
+    Fitting the unique patterns with their counts as `sample_weight` is the
+    same as fitting every row: the weights scale each pattern's responsibilities
+    in the M-step and its log-likelihood in the lower bound, bic, aic and score.
+    With `pattern_ids` (the pattern of every row) the k-means initialization
+    seeds over the rows like GaussianMixture on the rows would. Only the
+    default init_params="kmeans" is supported; predict and predict_proba are
+    the inherited ones, and the E-step goes through them.
+    """
+
+    def fit(self, X, y=None, sample_weight=None, pattern_ids=None):
+        self.fit_predict(X, y, sample_weight=sample_weight, pattern_ids=pattern_ids)
+        return self
+
+    def fit_predict(self, X, y=None, sample_weight=None, pattern_ids=None):
+        X = np.asarray(X, dtype=np.float64)
+        sample_weight = np.ones(len(X)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        if sample_weight.sum() < self.n_components:
+            raise ValueError(f"Expected n_samples >= n_components but got n_components = {self.n_components}, "
+                             f"n_samples = {sample_weight.sum():g}")
+        if self.init_params != "kmeans":
+            raise ValueError(f"WeightedGaussianMixture only supports init_params='kmeans', got {self.init_params!r}")
+        if self.covariance_type not in ("full", "tied", "diag", "spherical"):
+            raise ValueError(f"Invalid value for 'covariance_type': {self.covariance_type!r}")
+        if any(init is not None for init in (self.weights_init, self.means_init, self.precisions_init)):
+            raise ValueError("WeightedGaussianMixture does not take weights_init, means_init or precisions_init")
+        self.n_features_in_ = X.shape[1]
+        random_state = check_random_state(self.random_state)
+
+        max_lower_bound = -np.inf
+        self.converged_ = False
+        for _ in range(self.n_init):
+            self._initialize_weighted(X, sample_weight, pattern_ids, random_state)
+            lower_bound = -np.inf
+            converged = False
+            for n_iter in range(1, self.max_iter + 1):
+                prev_lower_bound = lower_bound
+                # E-step through the public methods: the same log-probabilities as GaussianMixture's
+                log_prob_norm, resp = self.score_samples(X), self.predict_proba(X)
+                self._m_step_weighted(X, sample_weight, resp)
+                lower_bound = np.average(log_prob_norm, weights=sample_weight)
+                if abs(lower_bound - prev_lower_bound) < self.tol:
+                    converged = True
+                    break
+
+            if lower_bound > max_lower_bound or max_lower_bound == -np.inf:
+                max_lower_bound = lower_bound
+                best_params = (self.weights_, self.means_, self.covariances_, self.precisions_cholesky_)
+                best_n_iter = n_iter
+                self.converged_ = converged
+
+        if not self.converged_ and self.max_iter > 0:
+            warnings.warn("Best performing initialization did not converge. Try different init parameters, "
+                          "or increase max_iter, tol, or check for degenerate data.", ConvergenceWarning)
+
+        self.weights_, self.means_, self.covariances_, self.precisions_cholesky_ = best_params
+        if self.covariance_type == "full":
+            self.precisions_ = self.precisions_cholesky_ @ self.precisions_cholesky_.transpose(0, 2, 1)
+        elif self.covariance_type == "tied":
+            self.precisions_ = self.precisions_cholesky_ @ self.precisions_cholesky_.T
+        else:
+            self.precisions_ = self.precisions_cholesky_ ** 2
+        self.n_iter_ = best_n_iter
+        self.lower_bound_ = max_lower_bound
+        # Labels consistent with fit(X).predict(X), as GaussianMixture.fit_predict does
+        return self.predict(X)
+
+    def _initialize_weighted(self, X, sample_weight, pattern_ids, random_state):
+        # The k-means labels of GaussianMixture(init_params="kmeans"), fitted on the weighted samples
+        if pattern_ids is not None:
+            labels = fit_pattern_kmeans((X, sample_weight, pattern_ids), self.n_components, random_state)[0].labels_
+        else:
+            labels = KMeans(n_clusters=self.n_components, n_init=1, random_state=random_state).fit(
+                X, sample_weight=sample_weight).labels_
+        resp = np.zeros((len(X), self.n_components))
+        resp[np.arange(len(X)), labels] = 1
+        self._m_step_weighted(X, sample_weight, resp)
+
+    def _m_step_weighted(self, X, sample_weight, resp):
+        # GaussianMixture's M-step, with every responsibility scaled by its sample's weight
+        resp = resp * sample_weight[:, np.newaxis]
+        nk = resp.sum(axis=0) + 10 * np.finfo(resp.dtype).eps
+        means = resp.T @ X / nk[:, np.newaxis]
+        n_features = X.shape[1]
+        if self.covariance_type == "full":
+            covariances = np.empty((self.n_components, n_features, n_features))
+            for k in range(self.n_components):
+                diff = X - means[k]
+                covariances[k] = (resp[:, k] * diff.T) @ diff / nk[k]
+                covariances[k].flat[::n_features + 1] += self.reg_covar
+        elif self.covariance_type == "tied":
+            covariances = ((X.T * sample_weight) @ X - (nk * means.T) @ means) / nk.sum()
+            covariances.flat[::n_features + 1] += self.reg_covar
+        else:
+            avg_X2 = resp.T @ (X * X) / nk[:, np.newaxis]
+            covariances = avg_X2 - means ** 2 + self.reg_covar
+            if self.covariance_type == "spherical":
+                covariances = covariances.mean(axis=1)
+        self.weights_ = nk / nk.sum()
+        self.means_ = means
+        self.covariances_ = covariances
+        self.precisions_cholesky_ = _precision_cholesky(covariances, self.covariance_type)
+
+    def _parameter_count(self):
+        n_features = self.means_.shape[1]
+        cov_params = {"full": self.n_components * n_features * (n_features + 1) / 2,
+                      "tied": n_features * (n_features + 1) / 2,
+                      "diag": self.n_components * n_features,
+                      "spherical": self.n_components}[self.covariance_type]
+        return int(cov_params + n_features * self.n_components + self.n_components - 1)
+
+    def score(self, X, y=None, sample_weight=None):
+        """Weighted mean log-likelihood of X."""
+        return np.average(self.score_samples(X), weights=sample_weight)
+
+    def bic(self, X, sample_weight=None):
+        """Bayesian information criterion of X, each sample counted `sample_weight` times."""
+        n_samples = len(X) if sample_weight is None else np.sum(sample_weight)
+        return -2 * self.score(X, sample_weight=sample_weight) * n_samples + self._parameter_count() * np.log(n_samples)
+
+    def aic(self, X, sample_weight=None):
+        """Akaike information criterion of X, each sample counted `sample_weight` times."""
+        n_samples = len(X) if sample_weight is None else np.sum(sample_weight)
+        return -2 * self.score(X, sample_weight=sample_weight) * n_samples + 2 * self._parameter_count()
+
+
+def _precision_cholesky(covariances, covariance_type):
+    """Cholesky factors of the precisions, in the layout GaussianMixture stores them."""
+    message = ("Fitting the mixture model failed because some components have ill-defined empirical covariance "
+               "(for instance caused by singleton or collapsed samples). Try to decrease the number of components, "
+               "or increase reg_covar.")
+    if covariance_type in ("full", "tied"):
+        try:
+            if covariance_type == "tied":
+                cov_chol = linalg.cholesky(covariances, lower=True)
+                return linalg.solve_triangular(cov_chol, np.eye(len(covariances)), lower=True).T
+            return np.stack([linalg.solve_triangular(linalg.cholesky(covariance, lower=True),
+                                                     np.eye(len(covariance)), lower=True).T
+                             for covariance in covariances])
+        except linalg.LinAlgError:
+            raise ValueError(message)
+    if np.any(covariances <= 0):
+        raise ValueError(message)
+    return 1 / np.sqrt(covariances)
+
+
+def fit_pattern_gmm(patterns, n_components, random_state=None, **params):
+    """
+    Fit a WeightedGaussianMixture (tied covariance unless given) on a pattern
+    histogram; returns (gmm, row labels). With fewer patterns than components
+    the mixture is fitted on the rows themselves, as GaussianMixture would be.
+    """
+    X_patterns, counts, inverse = patterns
+    params.setdefault("covariance_type", "tied")
+    gmm = WeightedGaussianMixture(n_components=n_components, random_state=random_state, **params)
+    if n_components > len(X_patterns):
+        return gmm, gmm.fit_predict(X_patterns[inverse])
+    pattern_labels = gmm.fit_predict(X_patterns, sample_weight=counts, pattern_ids=inverse)
+    return gmm, pattern_labels[inverse]
+
+
+def _relabel_linkage(Z, n):
+    """Number the merged clusters like scipy.cluster.hierarchy.linkage, from merges recorded by slot."""
+    parent = np.arange(2 * n - 1)
+    size = np.concatenate([np.ones(n), np.zeros(n - 1)])
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for k, (x, y) in enumerate(Z[:, :2].astype(np.intp)):
+        x_root, y_root = find(x), find(y)
+        Z[k, :2] = sorted((x_root, y_root))
+        parent[x_root] = parent[y_root] = n + k
+        size[n + k] = Z[k, 3] = size[x_root] + size[y_root]
+    return Z
+
+
+def pattern_ward_linkage(patterns):
+    """
+    Ward linkage of a pattern histogram, in the format of scipy's linkage().
+
+    Identical rows are merged first, at distance 0, by Ward on the full rows,
+    so each pattern starts as a cluster of `counts` rows and the tree above
+    them is the row tree: the Ward distance between two patterns is
+    sqrt(2 * a * b / (a + b)) times their Euclidean distance, and merged
+    clusters are updated with the Lance-Williams formula. The merges are found
+    with scipy's nearest-neighbour chain, ties included, so memory and time
+    depend on the number of patterns (at most 4096) instead of the rows. The
+    last column counts patterns, so the matrix is a valid linkage for scipy's
+    dendrogram; row_count_labels labels its leaves with row counts.
+    """
+    X_patterns, counts, inverse = patterns
+    n = len(X_patterns)
+    # On the rows each pattern's cluster ends up in the slot of its last row;
+    # visiting the patterns in that order breaks ties between equal distances the same way
+    last_row = np.zeros(n, dtype=np.intp)
+    np.maximum.at(last_row, inverse, np.arange(len(inverse)))
+    order = np.argsort(last_row)
+    size = counts[order].astype(np.float64)
+    D = squareform(pdist(X_patterns[order]))
+    for i in range(n):
+        # Row by row, to keep a single n x n matrix in memory
+        D[i] *= np.sqrt(2 * size[i] * size / (size[i] + size))
+    np.fill_diagonal(D, np.inf)
+
+    Z = np.empty((n - 1, 4))
+    chain = []
+    for k in range(n - 1):
+        if not chain:
+            chain = [int(np.flatnonzero(size)[0])]
+        # Follow nearest neighbours until two clusters are each other's nearest;
+        # the previous cluster in the chain wins ties, then the lowest index
+        while True:
+            x = chain[-1]
+            y = int(np.argmin(D[x]))
+            if len(chain) > 1 and not D[x, y] < D[x, chain[-2]]:
+                y = chain[-2]
+                break
+            chain.append(y)
+        del chain[-2:]
+
+        x, y = min(x, y), max(x, y)
+        dist, nx, ny = D[x, y], size[x], size[y]
+        Z[k] = x, y, dist, nx + ny
+
+        # Lance-Williams update for Ward: cluster y becomes the merged cluster, x is dropped
+        with np.errstate(invalid="ignore"):
+            merged = np.sqrt(((size + nx) * D[x] ** 2 + (size + ny) * D[y] ** 2 - size * dist ** 2)
+                             / (size + nx + ny))
+        merged[size == 0] = np.inf
+        D[y] = D[:, y] = merged
+        D[x] = D[:, x] = D[y, y] = np.inf
+        size[x], size[y] = 0, nx + ny
+
+    # Merges in order of distance (stable, as scipy sorts them), then clusters renumbered
+    Z = Z[np.argsort(Z[:, 2], kind="mergesort")]
+    Z[:, :2] = order[Z[:, :2].astype(np.intp)]
+    return _relabel_linkage(Z, n)
+
+
+def row_count_labels(linkage_matrix, counts):
+    """leaf_label_func for sch.dendrogram of a pattern linkage: the rows under each leaf, as "(n)"."""
+    n = len(counts)
+    rows = np.concatenate([counts, np.zeros(n - 1, dtype=counts.dtype)])
+    for k, (x, y) in enumerate(linkage_matrix[:, :2].astype(np.intp)):
+        rows[n + k] = rows[x] + rows[y]
+    return lambda node: f"({rows[node]})"
+
+
+def row_merge_distances(linkage_matrix, n_rows):
+    """
+    Merge distances of the Ward tree of all n_rows rows, in increasing order.
+
+    The row tree first merges identical rows at distance 0 (n_rows minus the
+    number of patterns merges), then makes the merges of the pattern tree.
+    """
+    return np.concatenate([np.zeros(n_rows - 1 - len(linkage_matrix)), linkage_matrix[:, 2]])
+
+
+def _cut_tree(linkage_matrix, n_clusters):
+    """
+    Leaf labels of a linkage cut into n_clusters, numbered as AgglomerativeClustering numbers them.
+
+    The clusters are the same as fcluster(linkage_matrix, n_clusters,
+    "maxclust") gives; sklearn numbers them in the order its heap of cluster
+    nodes ends up in, so the heap is replayed here.
+    """
+    n_leaves = len(linkage_matrix) + 1
+    children = linkage_matrix[:, :2].astype(np.intp)
+    nodes = [-(2 * n_leaves - 2)]
+    for _ in range(n_clusters - 1):
+        # The largest remaining node is the latest merge: undo it
+        these_children = children[-nodes[0] - n_leaves]
+        heappush(nodes, -these_children[0])
+        heappushpop(nodes, -these_children[1])
+
+    # Going down the tree from the root, every node takes its parent's label
+    labels = np.full(2 * n_leaves - 1, -1, dtype=np.intp)
+    labels[[-node for node in nodes]] = np.arange(len(nodes))
+    for k in range(n_leaves - 2, -1, -1):
+        if labels[n_leaves + k] >= 0:
+            labels[children[k]] = labels[n_leaves + k]
+    return labels[:n_leaves]
+
+
+def fit_pattern_ward(patterns, n_clusters, linkage_matrix=None):
+    """
+    Ward clustering of a pattern histogram; returns (linkage matrix, row labels).
+
+    The labels are numbered as AgglomerativeClustering(n_clusters,
+    linkage='ward') numbers them on the rows. Pass the linkage matrix from an
+    earlier call to cut the same tree at another number of clusters. Asking for
+    more clusters than patterns cuts into the zero-distance merges of identical
+    rows: every pattern becomes a cluster and single rows of repeated patterns
+    are split off as the remaining ones.
+    """
+    X_patterns, _, inverse = patterns
+    n_patterns = len(X_patterns)
+    if not 1 <= n_clusters <= len(inverse):
+        raise ValueError(f"n_clusters must be between 1 and the number of rows ({len(inverse)}), got {n_clusters}")
+    if linkage_matrix is None:
+        linkage_matrix = pattern_ward_linkage(patterns)
+    n_pattern_clusters = min(n_clusters, n_patterns)
+    if n_pattern_clusters == 1:
+        labels = np.zeros(len(inverse), dtype=np.intp)
+    else:
+        labels = _cut_tree(linkage_matrix, n_pattern_clusters)[inverse]
+    if n_clusters > n_patterns:
+        # Any split of identical rows is a Ward cut at distance 0: keep the first
+        # row of every pattern and give the first repeated rows their own clusters
+        repeated = np.ones(len(inverse), dtype=bool)
+        repeated[np.unique(inverse, return_index=True)[1]] = False
+        labels[np.flatnonzero(repeated)[:n_clusters - n_patterns]] = np.arange(n_patterns, n_clusters)
+    return linkage_matrix, labels
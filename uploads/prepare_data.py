@@ -1,208 +1,278 @@
-import pandas as pd
-import os
-
-pd.set_option('future.no_silent_downcasting', True)
-# Assuming your xlsx file is in your Google Drive, replace with actual path
-script_dir = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(script_dir,"uploaded_file.xlsx")
-
-try:
-  df = pd.read_excel(file_path, index_col=1)
-#   print(df.head()) # Print the first few rows to verify
-except FileNotFoundError:
-  print(f"Error: File not found at {file_path}")
-except Exception as e:
-  print(f"An error occurred: {e}")
-
-
-# Replace '√' with 1 and empty/NaN values with 0
-df = df.replace('√', 1).infer_objects(copy=False)
-df = df.fillna(0)
-
-# Strip leading and trailing spaces from all column names
-df.columns = df.columns.str.strip()
-df.columns = df.columns.str.upper()
-
-# Verify the column names after stripping spaces
-# print(df.columns)
-
-# # Remove rows where 'LOKASI' is 'Jakarta Pusat'
-# df = df[df['LOKASI'] != 'Jakarta Pusat']
-
-df = df.drop(columns=['NAMA', 'NIP'], errors='ignore')
-
-
-
-# ================================================================
-
-# # Calculate counts for each UNIT KERJA
-# unit_kerja_counts = df['UNIT KERJA'].value_counts()
-
-# # Determine the threshold using the formula (mean - standard deviation)
-# threshold = unit_kerja_counts.mean() - unit_kerja_counts.std()
-
-# proportion = 0.005  # For example, 0.5% of the total rows
-# total_rows = df.shape[0]
-# threshold = total_rows * proportion
-
-# # Step 2: Filter out UNIT KERJA with counts below the threshold
-# unit_kerja_counts = df['UNIT KERJA'].value_counts()
-# filtered_units = unit_kerja_counts[unit_kerja_counts >= threshold].index
-
-# # Step 3: Keep only rows with UNIT KERJA above the threshold
-# df_filtered = df[df['UNIT KERJA'].isin(filtered_units)]
-
-df_filtered = df.copy()
-# Step 4: Save the filtered DataFrame to a new Excel file
-output_file_path = os.path.join(script_dir,"data_ready.xlsx")
-df_filtered.to_excel(output_file_path, index=False)
-
-# ================================================================
-
-
-doc_columns = [
-    "FOTO 1/2 BADAN (*)", "FOTO FULL BODY (*)", "AKTA LAHIR (*)", 
-    "KTP (*)", "NPWP(*)", "SUMPAH PNS", "NOTA BKN", "SPMT CPNS", 
-    "KARTU ASN VIRTUAL", "NO NPWP", "NO BPJS", "NO KK"
-]
-
-# Full list of columns to group by (first priority is UNIT KERJA)
-group_cols = ['UNIT KERJA', 'TINGKAT', 'LOKASI', 'PROVINSI', 'STATUS', 'JENIS KELAMIN', 'BULAN', 'TAHUN']
-
-df_unitkerja = df_filtered.copy()
-
-# Make sure document columns are numeric
-df_unitkerja.loc[:, doc_columns] = df_unitkerja[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-
-# Group by all relevant columns
-grouped_df_unitkerja = df_unitkerja.groupby(group_cols)[doc_columns].sum().reset_index()
-
-# Optional: Add total document count
-grouped_df_unitkerja['TOTAL DOKUMEN'] = grouped_df_unitkerja[doc_columns].sum(axis=1)
-
-# add a new column 'NO' with sequential numbers starting from 1
-grouped_df_unitkerja.insert(0, 'NO', range(1, len(grouped_df_unitkerja) + 1))
-
-# Save to Excel
-output_file_path = os.path.join(script_dir, "data_view.xlsx")
-grouped_df_unitkerja.to_excel(output_file_path, index=False)
-
-
-# ============================================================
-
-# Groupby Tingkat
-group_cols = ['TINGKAT']
-
-df_tingkat = df_filtered.copy()
-
-# Make sure document columns are numeric
-df_tingkat.loc[:, doc_columns] = df_tingkat[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-
-# Group by all relevant columns
-grouped_df_tingkat = df_tingkat.groupby(group_cols)[doc_columns].sum().reset_index()
-
-# Optional: Add total document count
-grouped_df_tingkat['TOTAL DOKUMEN'] = grouped_df_tingkat[doc_columns].sum(axis=1)
-
-# add a new column 'NO' with sequential numbers starting from 1
-grouped_df_tingkat.insert(0, 'NO', range(1, len(grouped_df_tingkat) + 1))
-
-# Save to Excel
-output_file_path = os.path.join(script_dir, "data_view_tingkat.xlsx")
-grouped_df_tingkat.to_excel(output_file_path, index=False)
-
-
-# ============================================================
-
-# Groupby Lokasi
-group_cols = ['LOKASI']
-
-df_lokasi = df_filtered.copy()
-
-# Make sure document columns are numeric
-df_lokasi.loc[:, doc_columns] = df_lokasi[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-
-# Group by all relevant columns
-grouped_df_lokasi = df_lokasi.groupby(group_cols)[doc_columns].sum().reset_index()
-
-# Optional: Add total document count
-grouped_df_lokasi['TOTAL DOKUMEN'] = grouped_df_lokasi[doc_columns].sum(axis=1)
-
-# add a new column 'NO' with sequential numbers starting from 1
-grouped_df_lokasi.insert(0, 'NO', range(1, len(grouped_df_lokasi) + 1))
-
-# Save to Excel
-output_file_path = os.path.join(script_dir, "data_view_lokasi.xlsx")
-grouped_df_lokasi.to_excel(output_file_path, index=False)
-
-
-# ============================================================
-
-# Groupby Provinsi
-group_cols = ['PROVINSI']
-
-df_provinsi = df_filtered.copy()
-
-# Make sure document columns are numeric
-df_provinsi.loc[:, doc_columns] = df_provinsi[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-
-# Group by all relevant columns
-grouped_df_provinsi = df_provinsi.groupby(group_cols)[doc_columns].sum().reset_index()
-
-# Optional: Add total document count
-grouped_df_provinsi['TOTAL DOKUMEN'] = grouped_df_provinsi[doc_columns].sum(axis=1)
-
-# add a new column 'NO' with sequential numbers starting from 1
-grouped_df_provinsi.insert(0, 'NO', range(1, len(grouped_df_provinsi) + 1))
-
-# Save to Excel
-output_file_path = os.path.join(script_dir, "data_view_provinsi.xlsx")
-grouped_df_provinsi.to_excel(output_file_path, index=False)
-
-
-# ============================================================
-
-# Groupby STATUS
-group_cols = ['STATUS']
-
-df_status = df_filtered.copy()
-
-# Make sure document columns are numeric
-df_status.loc[:, doc_columns] = df_status[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-
-# Group by all relevant columns
-grouped_df_status = df_status.groupby(group_cols)[doc_columns].sum().reset_index()
-
-# Optional: Add total document count
-grouped_df_status['TOTAL DOKUMEN'] = grouped_df_status[doc_columns].sum(axis=1)
-
-# add a new column 'NO' with sequential numbers starting from 1
-grouped_df_status.insert(0, 'NO', range(1, len(grouped_df_status) + 1))
-
-# Save to Excel
-output_file_path = os.path.join(script_dir, "data_view_status.xlsx")
-grouped_df_status.to_excel(output_file_path, index=False)
-
-
-# ============================================================
-
-# Groupby JENIS KELAMIN
-group_cols = ['JENIS KELAMIN']
-
-df_jeniskelamin = df_filtered.copy()
-
-# Make sure document columns are numeric
-df_jeniskelamin.loc[:, doc_columns] = df_jeniskelamin[doc_columns].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-
-# Group by all relevant columns
-grouped_df_jeniskelamin = df_jeniskelamin.groupby(group_cols)[doc_columns].sum().reset_index()
-
-# Optional: Add total document count
-grouped_df_jeniskelamin['TOTAL DOKUMEN'] = grouped_df_jeniskelamin[doc_columns].sum(axis=1)
-
-# add a new column 'NO' with sequential numbers starting from 1
-grouped_df_jeniskelamin.insert(0, 'NO', range(1, len(grouped_df_jeniskelamin) + 1))
-
-# Save to Excel
-output_file_path = os.path.join(script_dir, "data_view_jeniskelamin.xlsx")
-grouped_df_jeniskelamin.to_excel(output_file_path, index=False)
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from columns import doc_columns, group_cols, period_cols, view_groupings
+from aggregation import CellAccumulator
+from data_snapshot import SnapshotBuilder, snapshot_path_for
+from excel_reader import read_excel
+from excel_writer import StreamingExcelWriter, write_outputs
+from fingerprint import code_version, file_sha256, is_up_to_date, record_run, run_key
+from ingest import (DEFAULT_CHUNK_SIZE, expand_inputs, is_delimited, iter_delimited_chunks, iter_excel_chunks,
+                    iter_workbook_parts, normalize_upload)
+from region_summary import build_region_summary, load_region_rows, read_region_titles
+from schema import validate_upload
+from view_json import json_path_for, write_json_gz
+
+pd.set_option('future.no_silent_downcasting', True)
+
+parser = argparse.ArgumentParser(description="Prepare the uploaded workbook for the map views and the models.")
+parser.add_argument("--stream", action="store_true",
+                    help="read the upload in chunks with bounded memory (for very large workbooks)")
+parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                    help=f"rows per chunk in --stream mode (default: {DEFAULT_CHUNK_SIZE})")
+parser.add_argument("--append", action="store_true",
+                    help="merge the upload's BULAN/TAHUN period(s) into the stored results instead of "
+                         "rebuilding them from scratch; a period that was loaded before is replaced")
+parser.add_argument("--force", action="store_true",
+                    help="run even when the upload is byte-identical to the last one")
+parser.add_argument("--upload", metavar="PATH",
+                    help="file to prepare instead of uploaded_file.xlsx; .csv/.tsv exports are streamed "
+                         "in chunks and skip data_ready.xlsx")
+parser.add_argument("--inputs", nargs="+", metavar="PATH",
+                    help="consolidate these workbooks (directories: every .xlsx in them), all sheets "
+                         "of each, instead of uploaded_file.xlsx")
+parser.add_argument("--workers", type=int, default=None,
+                    help="processes used to parse --inputs and to write the output workbooks "
+                         "(default: one per CPU core)")
+args = parser.parse_args()
+
+# Assuming your xlsx file is in your Google Drive, replace with actual path
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file_path = args.upload or os.path.join(script_dir,"uploaded_file.xlsx")
+output_file_path = os.path.join(script_dir,"data_ready.xlsx")
+
+# CSV/TSV exports never go through Excel: the snapshot is their only data_ready copy
+delimited_input = not args.inputs and is_delimited(file_path)
+write_ready_xlsx = not args.append and not delimited_input
+
+cells_file = os.path.join(script_dir, "data_view_cells.npz")
+regions_file = os.path.join(script_dir, "data_view_regions.json.gz")
+snapshot_file = snapshot_path_for(output_file_path)
+
+# ================================================================
+# SKIP UNCHANGED UPLOADS
+# ================================================================
+
+fingerprint_file = os.path.join(script_dir, "prepare_data_fingerprint.json")
+view_files = [os.path.join(script_dir, name) for name in view_groupings]
+prepared_outputs = [cells_file, snapshot_file, regions_file] + view_files + [json_path_for(path) for path in view_files]
+if write_ready_xlsx:
+    prepared_outputs.append(output_file_path)
+
+if args.inputs:
+    try:
+        input_files = expand_inputs(args.inputs)
+    except FileNotFoundError as e:
+        print(f"Error: File not found at {e}")
+        sys.exit(1)
+    if not input_files:
+        print(f"Error: No .xlsx files found in {', '.join(args.inputs)}")
+        sys.exit(1)
+    file_path = ", ".join(input_files)
+    upload_sha256 = run_key(*(file_sha256(path) for path in input_files))
+else:
+    upload_sha256 = file_sha256(file_path) if os.path.exists(file_path) else None
+prepare_key = run_key(upload_sha256, code_version(__file__), "append" if args.append else "full")
+
+if not args.force and is_up_to_date(fingerprint_file, prepare_key, prepared_outputs):
+    print(f"Upload unchanged (sha256 {upload_sha256[:12]}); reusing the existing prepared data")
+    sys.exit(0)
+
+# ================================================================
+# VALIDATE THE HEADER BEFORE ANY FULL PARSE
+# ================================================================
+
+schema_errors = []
+for path in (input_files if args.inputs else [file_path]):
+    errors, warnings = validate_upload(path, all_sheets=bool(args.inputs))
+    schema_errors += errors
+    for warning in warnings:
+        print(f"Warning: {warning}")
+if schema_errors:
+    for error in schema_errors:
+        print(f"Error: {error}")
+    sys.exit(1)
+
+# ================================================================
+# LOAD THE UPLOAD
+# ================================================================
+
+read_start = time.perf_counter()
+
+if args.inputs:
+    # Every sheet of every workbook, parsed and pre-aggregated in a process pool
+    chunks = iter_workbook_parts(input_files, args.workers)
+
+elif delimited_input:
+    # Delimited text export: read in chunks with explicit column types
+    chunks = ((chunk, coerced, None) for chunk, coerced in iter_delimited_chunks(file_path, args.chunk_size))
+
+elif args.stream:
+    # Normalized chunk by chunk straight from openpyxl's read_only rows
+    chunks = ((chunk, coerced, None) for chunk, coerced in iter_excel_chunks(file_path, args.chunk_size))
+
+else:
+    try:
+        df = read_excel(file_path, index_col=1)
+    #   print(df.head()) # Print the first few rows to verify
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        sys.exit(1)
+
+    # Document cells -> int8 flags ('√' -> 1), empty/NaN values -> 0, strip/upper
+    # the column names and drop NAMA/NIP
+    df, coerced = normalize_upload(df)
+
+    # Verify the column names after stripping spaces
+    # print(df.columns)
+
+    # # Remove rows where 'LOKASI' is 'Jakarta Pusat'
+    # df = df[df['LOKASI'] != 'Jakarta Pusat']
+
+    # ================================================================
+
+    # # Calculate counts for each UNIT KERJA
+    # unit_kerja_counts = df['UNIT KERJA'].value_counts()
+
+    # # Determine the threshold using the formula (mean - standard deviation)
+    # threshold = unit_kerja_counts.mean() - unit_kerja_counts.std()
+
+    # proportion = 0.005  # For example, 0.5% of the total rows
+    # total_rows = df.shape[0]
+    # threshold = total_rows * proportion
+
+    # # Step 2: Filter out UNIT KERJA with counts below the threshold
+    # unit_kerja_counts = df['UNIT KERJA'].value_counts()
+    # filtered_units = unit_kerja_counts[unit_kerja_counts >= threshold].index
+
+    # # Step 3: Keep only rows with UNIT KERJA above the threshold
+    # df_filtered = df[df['UNIT KERJA'].isin(filtered_units)]
+
+    df_filtered = df
+    chunks = [(df_filtered, coerced, None)]
+
+# ================================================================
+# ACCUMULATE: data_ready rows, snapshot columns and data_view cells
+# ================================================================
+
+if args.append:
+    # Start from the persisted history instead of re-reading it
+    if not os.path.exists(cells_file) or not os.path.exists(snapshot_file):
+        print("Error: --append needs the results of a previous full run of prepare_data.py")
+        sys.exit(1)
+    try:
+        accumulator = CellAccumulator.load(cells_file)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    snapshot = SnapshotBuilder.from_snapshot(snapshot_file)
+else:
+    accumulator = CellAccumulator(doc_columns, group_cols)
+    snapshot = SnapshotBuilder(doc_columns)
+
+writer = None
+# Whole-upload frame written to data_ready.xlsx in the write phase (non-streaming reads)
+ready_df = None
+appended_periods = set()
+row_count = 0
+coerced_cells = 0
+
+try:
+    for chunk, coerced, cells in chunks:
+        if snapshot.columns and list(chunk.columns) != snapshot.columns and set(chunk.columns) == set(snapshot.columns):
+            # Workbooks/sheets may list the same columns in another order
+            chunk = chunk[snapshot.columns]
+
+        if args.append:
+            # A period that is uploaded again replaces the stored one instead of being added twice
+            chunk_periods = set(chunk[period_cols].drop_duplicates().itertuples(index=False, name=None))
+            new_periods = chunk_periods - appended_periods
+            accumulator.drop_periods(period_cols, new_periods)
+            snapshot.drop_periods(period_cols, new_periods)
+            appended_periods |= new_periods
+        elif delimited_input:
+            # No data_ready.xlsx for text exports; the snapshot below holds the rows
+            pass
+        elif args.stream or args.inputs:
+            if writer is None:
+                writer = StreamingExcelWriter(output_file_path, chunk.columns)
+            writer.append(chunk)
+        else:
+            # Step 4: Save the filtered DataFrame to a new Excel file (in the write phase below)
+            ready_df = chunk
+
+        snapshot.append(chunk)
+        if cells is None:
+            accumulator.add(chunk)
+        else:
+            # Group sums already computed by the worker process
+            accumulator.merge(cells)
+        row_count += len(chunk)
+        coerced_cells += coerced
+except FileNotFoundError:
+    print(f"Error: File not found at {file_path}")
+    sys.exit(1)
+except ValueError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+
+if row_count == 0:
+    print(f"Error: No data rows found in {file_path}")
+    sys.exit(1)
+
+if writer is not None:
+    writer.close()
+print(f"Read and aggregated {row_count} rows in {time.perf_counter() - read_start:.2f} s")
+
+if coerced_cells:
+    print(f"Coerced {coerced_cells} document cell(s) that were not '√', blank or a whole number")
+
+if args.append:
+    periods = ", ".join(" ".join(str(value) for value in period) for period in sorted(appended_periods, key=str))
+    print(f"Appended {row_count} rows for period(s): {periods}")
+
+accumulator.save(cells_file)
+
+# Roll the cells up into every data_view* grouping
+views = accumulator.build_views(view_groupings)
+
+# ================================================================
+# WRITE PHASE: data_ready.xlsx and the data_view tables, in parallel
+# ================================================================
+
+# Save to Excel (downloads) and as gzipped JSON (rendered by the map page)
+write_jobs = [(grouped_df, os.path.join(script_dir, file_name), json_path_for(os.path.join(script_dir, file_name)))
+              for file_name, grouped_df in views.items()]
+if ready_df is not None:
+    write_jobs.append((ready_df, output_file_path, None))
+
+write_start = time.perf_counter()
+write_outputs(write_jobs, args.workers)
+print(f"Wrote {len(write_jobs)} output workbook(s) in {time.perf_counter() - write_start:.2f} s")
+
+# Typed columnar snapshot of data_ready for the training scripts (tied to the
+# data_ready.xlsx just written)
+if not write_ready_xlsx:
+    # data_ready.xlsx would need the whole history rewritten (append) or is not
+    # written at all (text export); the snapshot now holds the only up-to-date
+    # copy, so drop the outdated workbook
+    snapshot.write(snapshot_file, None)
+    if os.path.exists(output_file_path):
+        os.remove(output_file_path)
+else:
+    snapshot.write(snapshot_file, output_file_path)
+
+# One precomputed record per map region (keyed by the <area> titles) for map clicks
+lokasi, present, doc_mask = load_region_rows(os.path.join(script_dir, "data_ready.xlsx"), doc_columns)
+write_json_gz(build_region_summary(accumulator, lokasi, present, read_region_titles(), doc_mask), regions_file)
+
+# Remember what this upload produced so an identical re-upload can be skipped
+record_run(fingerprint_file, prepare_key, prepared_outputs,
+           upload_sha256=upload_sha256, data_sha256=snapshot.data_sha256)
@@ -0,0 +1,166 @@
+# ==============================
+# PER-REGION SUMMARIES FOR THE MAP
+# ==============================
+
+# prepare_data.py writes data_view_regions.json.gz: one small record per region
+# of the Jawa Timur map, keyed by the exact <area> titles in
+# "static/polygon before resize.xml", so clicking a region is a lookup instead of
+# a search over every row of data_view.
+#
+# Each record holds the employee and document totals, the completeness
+# percentage, how many employees have 0..12 documents, and the largest units.
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from aggregation import ROW_COUNT
+from data_snapshot import load_doc_mask, load_snapshot, snapshot_path_for
+from doc_mask import doc_counts, present_counts
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+polygon_file = os.path.join(script_dir, "..", "static", "polygon before resize.xml")
+
+# Number of units listed per region
+TOP_UNITS = 5
+
+# Spellings used by the map titles for names that are usually written differently
+REGION_ALIASES = {"tulungagung": "tulunganggung"}
+
+
+def read_region_titles(file_path=polygon_file):
+    """The <area> titles of the map, in file order (empty when the file is missing)."""
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, encoding="utf-8") as f:
+        titles = re.findall(r'<area\b[^>]*\btitle="([^"]*)"', f.read())
+    return list(dict.fromkeys(title.strip() for title in titles))
+
+
+def region_key(name):
+    """('kab'|'kota'|None, name) with the prefix, case, spacing and punctuation normalized away."""
+    words = re.sub(r"[^a-z]+", " ", str(name).lower()).split()
+    kind = None
+    if words and words[0] in ("kab", "kabupaten"):
+        kind, words = "kab", words[1:]
+    elif words and words[0] in ("kota", "kotamadya"):
+        kind, words = "kota", words[1:]
+    name = "".join(words)
+    return kind, REGION_ALIASES.get(name, name)
+
+
+def match_regions(lokasi_values, titles):
+    """
+    Map every LOKASI value to a map title: first on prefix + name, then on the
+    name alone when only one title carries it (e.g. "Kota Batu" -> "Kab. Batu").
+    Values that match no title (or several) are left out.
+    """
+    by_key = {region_key(title): title for title in titles}
+    by_name = {}
+    for (_, name), title in by_key.items():
+        by_name.setdefault(name, []).append(title)
+
+    matches = {}
+    for value in lokasi_values:
+        key = region_key(value)
+        if key in by_key:
+            matches[value] = by_key[key]
+        elif len(by_name.get(key[1], [])) == 1:
+            matches[value] = by_name[key[1]][0]
+    return matches
+
+
+def _completeness(documents, employees, n_docs):
+    return round(100.0 * documents / (employees * n_docs), 2) if employees else 0.0
+
+
+def _record(lokasi, lokasi_totals, lokasi_units, lokasi_distribution, lokasi_documents, doc_columns):
+    n_docs = len(doc_columns)
+    documents = (sum(lokasi_documents[value] for value in lokasi) if lokasi
+                 else np.zeros(n_docs, dtype=np.int64))
+    employees = int(lokasi_totals.loc[lokasi, ROW_COUNT].sum()) if lokasi else 0
+
+    units = lokasi_units[lokasi_units['LOKASI'].isin(lokasi)].groupby('UNIT KERJA')[doc_columns + [ROW_COUNT]].sum()
+    units = units.sort_values(ROW_COUNT, ascending=False, kind="stable").head(TOP_UNITS)
+
+    return {
+        "lokasi": list(lokasi),
+        "employees": employees,
+        "documents": {col: int(value) for col, value in zip(doc_columns, documents)},
+        "total_documents": int(documents.sum()),
+        "completeness": _completeness(int(documents.sum()), employees, n_docs),
+        # distribution[k] = employees with exactly k documents present
+        "distribution": [int(count) for count in sum(
+            (lokasi_distribution[value] for value in lokasi), np.zeros(n_docs + 1, dtype=np.int64))],
+        "top_units": [
+            {
+                "unit": str(unit),
+                "employees": int(row[ROW_COUNT]),
+                "completeness": _completeness(int(row[doc_columns].sum()), int(row[ROW_COUNT]), n_docs),
+            }
+            for unit, row in units.iterrows()
+        ],
+    }
+
+
+def build_region_summary(cube, lokasi, present, titles, doc_mask=None):
+    """
+    Build the region records from the cell cube (units) and the per-row LOKASI
+    values and document counts (completeness distribution). Document totals are
+    tallied from the packed `doc_mask` when there is one, else taken from the cube.
+    """
+    doc_columns = cube.doc_columns
+    lokasi_totals = cube.rollup(['LOKASI']).set_index('LOKASI')
+    lokasi_units = cube.rollup(['LOKASI', 'UNIT KERJA'])
+
+    # Employees per (LOKASI, documents present) in one bincount. Document cells
+    # other than 0/1 (e.g. 2 or -1) make the row sum leave 0..n_docs, which would
+    # shift a row into the next region's bucket or make bincount raise
+    present = np.clip(np.asarray(present, dtype=np.int64), 0, len(doc_columns))
+    codes, uniques = pd.factorize(np.asarray(lokasi))
+    histogram = np.bincount(codes * (len(doc_columns) + 1) + present,
+                            minlength=len(uniques) * (len(doc_columns) + 1))
+    histogram = histogram.reshape(len(uniques), len(doc_columns) + 1)
+    lokasi_distribution = {value: histogram[i] for i, value in enumerate(uniques)}
+
+    if doc_mask is not None:
+        # Per-document totals per LOKASI from one (LOKASI, mask) histogram
+        documents = doc_counts(doc_mask, len(doc_columns), codes, len(uniques))
+        lokasi_documents = {value: documents[i] for i, value in enumerate(uniques)}
+    else:
+        lokasi_documents = {value: row.to_numpy() for value, row in lokasi_totals[doc_columns].iterrows()}
+
+    matches = match_regions(lokasi_totals.index, titles)
+    regions = {}
+    for title in titles:
+        members = [value for value, matched in matches.items() if matched == title]
+        regions[title] = _record(members, lokasi_totals, lokasi_units, lokasi_distribution, lokasi_documents,
+                                 doc_columns)
+
+    unmatched = {
+        str(value): _record([value], lokasi_totals, lokasi_units, lokasi_distribution, lokasi_documents,
+                            doc_columns)
+        for value in lokasi_totals.index if value not in matches
+    }
+
+    # Other spellings of a title (e.g. the page's "Kab. Tulungagung") -> the title used as key
+    aliases = {}
+    for title in titles:
+        for spelling, alias in REGION_ALIASES.items():
+            if alias in title.lower():
+                aliases[re.sub(alias, spelling.capitalize(), title, flags=re.IGNORECASE)] = title
+
+    return {"regions": regions, "aliases": aliases, "unmatched": unmatched}
+
+
+def load_region_rows(data_ready_file, doc_columns):
+    """
+    LOKASI, number of documents present and packed document mask (None when the
+    flags are not 0/1) for every row of data_ready (from its snapshot).
+    """
+    doc_mask = load_doc_mask(data_ready_file)
+    columns = ['LOKASI'] + (doc_columns if doc_mask is None else [])
+    rows = load_snapshot(snapshot_path_for(data_ready_file), data_ready_file, columns=columns)
+    return rows['LOKASI'].to_numpy(), present_counts(rows, doc_columns, doc_mask).astype(np.int64), doc_mask
@@ -0,0 +1,165 @@
+# ==============================
+# HEADER-ONLY SCHEMA VALIDATION OF UPLOADS
+# ==============================
+
+# prepare_data.py checks the header (and a few sample rows) of every upload
+# before anything is parsed in full: all doc_columns and group_cols must be
+# present once, numeric grouping columns must hold whole numbers and document
+# cells should be check marks, blanks or numbers. A bad upload is rejected in
+# milliseconds instead of failing after the full parse, or producing a
+# data_ready that makes every trainer fail later.
+
+import csv
+import itertools
+import math
+import os
+
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.worksheet._reader import WorkSheetParser
+
+from columns import doc_columns, group_cols, numeric_group_cols
+from excel_reader import read_excel
+from ingest import CHECKMARKS, DELIMITED_SUFFIXES, is_delimited, sniff_delimiter
+
+# Data rows read after the header to check the column types
+SAMPLE_ROWS = 50
+
+
+def _sheet_rows(reader, target, n_rows):
+    """The first `n_rows` rows of one sheet as lists of values, parsed lazily."""
+    rows = []
+    with reader.archive.open(target) as src:
+        parser = WorkSheetParser(src, reader.shared_strings, data_only=True)
+        for _, cells in itertools.islice(parser.parse(), n_rows):
+            row = [None] * max((cell["column"] for cell in cells), default=0)
+            for cell in cells:
+                row[cell["column"] - 1] = cell["value"]
+            rows.append(row)
+    return rows
+
+
+def _sheet_heads(file_path, sample_rows):
+    """(sheet name, header, sample rows) for every sheet of a workbook, without reading it all."""
+    # Sheets are parsed row by row and left after sample_rows: load_workbook(read_only=True)
+    # would scan a whole sheet written without a <dimension> (write-only exports) to size it
+    # (17 s for 150k rows). ExcelReader and WorkSheetParser are openpyxl internals, hence
+    # the openpyxl pin in requirements.txt
+    try:
+        reader = ExcelReader(file_path, read_only=True, data_only=True)
+        reader.read_manifest()
+        reader.read_strings()
+        reader.read_workbook()
+    except Exception:
+        # Not something openpyxl opens (e.g. an .xls saved as .xlsx): let the configured reader try
+        sheets = read_excel(file_path, sheet_name=None, header=None, nrows=sample_rows + 1)
+        heads = []
+        for name, df in sheets.items():
+            # Blank cells as None, like openpyxl gives them
+            df = df.astype(object).where(df.notna(), None)
+            heads.append((name, list(df.iloc[0]) if len(df) else [], df.iloc[1:].values.tolist()))
+        return heads
+
+    heads = []
+    try:
+        for sheet, rel in reader.parser.find_sheets():
+            rows = _sheet_rows(reader, rel.target, sample_rows + 1)
+            heads.append((sheet.name, rows[0] if rows else [], rows[1:]))
+    finally:
+        reader.archive.close()
+    return heads
+
+
+def _delimited_head(file_path, sample_rows):
+    with open(file_path, encoding="utf-8-sig", newline="") as f:
+        header_line = f.readline()
+        sep = sniff_delimiter(header_line, DELIMITED_SUFFIXES.get(os.path.splitext(file_path)[1].lower(), ","))
+        reader = csv.reader(f, delimiter=sep)
+        rows = [row for _, row in zip(range(sample_rows), reader)]
+    header = next(csv.reader([header_line], delimiter=sep), [])
+    # Empty text cells are missing values, as read_csv treats them
+    return [("", header, [[value if value != "" else None for value in row] for row in rows])]
+
+
+def _as_number(value):
+    """The value as a finite float, or None when it is not a number."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value.strip()) if isinstance(value, str) else float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _column_values(rows, position):
+    return [row[position] for row in rows if position < len(row) and row[position] is not None]
+
+
+def check_sheet(header, rows, label=""):
+    """Validate one sheet's header and sample rows; returns (errors, warnings)."""
+    errors, warnings = [], []
+    names = [str(name).strip().upper() if name is not None else "" for name in header]
+    prefix = f"{label}: " if label else ""
+
+    if len(names) < 2:
+        return [f"{prefix}no header row with column names found"], warnings
+
+    # The second column (NAMA) is used as the index and dropped, like in the reader paths
+    kept = {name: position for position, name in enumerate(names) if position != 1}
+    duplicates = sorted({name for name in names if name and names.count(name) > 1})
+    if duplicates:
+        errors.append(f"{prefix}duplicate column(s): {', '.join(duplicates)}")
+
+    missing = [col for col in doc_columns + group_cols if col not in kept]
+    if missing:
+        errors.append(f"{prefix}missing required column(s): {', '.join(missing)}")
+        if names[1] in missing:
+            errors.append(f"{prefix}column {header[1]!r} is in the second position, which is reserved for NAMA")
+
+    for col in numeric_group_cols:
+        if col in kept:
+            bad = [value for value in _column_values(rows, kept[col])
+                   if _as_number(value) is None or not _as_number(value).is_integer()]
+            if bad:
+                errors.append(f"{prefix}column {col} must hold whole numbers, found {bad[0]!r}")
+
+    for col in doc_columns:
+        if col in kept:
+            bad = [value for value in _column_values(rows, kept[col])
+                   if str(value).strip() not in CHECKMARKS + [""] and _as_number(value) is None]
+            if bad:
+                warnings.append(f"{prefix}column {col} has values other than '√', blank or a number "
+                                f"(e.g. {bad[0]!r}); they will be counted as missing")
+
+    return errors, warnings
+
+
+def validate_upload(file_path, all_sheets=False, sample_rows=SAMPLE_ROWS):
+    """
+    Check an upload from its header and first rows only; returns (errors, warnings).
+
+    Only the first sheet of a workbook is used unless `all_sheets` (--inputs),
+    in which case every sheet with any content is checked.
+    """
+    if not os.path.exists(file_path):
+        return [f"File not found at {file_path}"], []
+
+    try:
+        if is_delimited(file_path):
+            heads = _delimited_head(file_path, sample_rows)
+        else:
+            heads = _sheet_heads(file_path, sample_rows)
+    except Exception as e:
+        return [f"{os.path.basename(file_path)} could not be read: {e}"], []
+
+    if not all_sheets:
+        heads = heads[:1]
+    errors, warnings = [], []
+    for sheet_name, header, rows in heads:
+        if all_sheets and not any(value is not None for value in header):
+            continue  # empty sheet, skipped by the reader as well
+        label = os.path.basename(file_path) + (f" [{sheet_name}]" if all_sheets else "")
+        sheet_errors, sheet_warnings = check_sheet(header, rows, label)
+        errors += sheet_errors
+        warnings += sheet_warnings
+    return errors, warnings
@@ -0,0 +1,65 @@
+# ==============================
+# SNAPSHOT META RECORDS
+# ==============================
+
+# The .npz files of the pipeline (data_ready.npz, data_view_cells.npz, the
+# lookup tables) carry a JSON meta record next to their arrays. Reading it only
+# needs NumPy, so the training scripts can check whether the prepared data
+# changed before they import pandas, matplotlib or scikit-learn.
+
+import json
+import os
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path_for(xlsx_path):
+    """Return the snapshot file that belongs to an Excel file (data_ready.xlsx -> data_ready.npz)."""
+    return os.path.splitext(xlsx_path)[0] + ".npz"
+
+
+def file_stamp(path):
+    """Size and modification time of a file, to tell whether it changed since it was recorded."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save_npz(file_path, arrays, meta):
+    """Write arrays plus a JSON meta record to an .npz file, atomically."""
+    arrays = dict(arrays, __meta__=np.array(json.dumps(meta)))
+
+    # Write to a temporary file first so readers never see a half-written file
+    tmp_file = file_path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_file, file_path)
+
+
+def read_npz_meta(data):
+    """Return the JSON meta record of an opened .npz file."""
+    return json.loads(str(data["__meta__"]))
+
+
+def read_snapshot_meta(snapshot_file, source_file):
+    """Return the snapshot's meta record, or None when it is missing or stale."""
+    if not os.path.exists(snapshot_file):
+        return None
+
+    with np.load(snapshot_file, allow_pickle=False) as data:
+        meta = read_npz_meta(data)
+    if meta.get("version") != SNAPSHOT_VERSION:
+        return None
+    # A standalone snapshot is the only copy of the data; otherwise it must match the xlsx
+    if meta.get("source") is not None and (
+        not os.path.exists(source_file) or meta["source"] != file_stamp(source_file)
+    ):
+        return None
+    return meta
+
+
+def snapshot_data_hash(file_path):
+    """Fingerprint of the data behind data_ready (None without an up-to-date snapshot)."""
+    meta = read_snapshot_meta(snapshot_path_for(file_path), file_path)
+    return meta.get("data_sha256") if meta is not None else None
@@ -0,0 +1,118 @@
+# ==============================
+# PATTERN FITS AGAINST SCIKIT-LEARN ON THE ROWS
+# ==============================
+
+# The pattern fits promise the clustering (and metrics) scikit-learn gives on
+# the full rows. These checks run both on small uploads-like matrices, so a
+# scikit-learn release that changes behaviour shows up here.
+# Run from uploads/: python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.cluster.hierarchy import ward
+from sklearn.cluster import AgglomerativeClustering, KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+from sklearn.mixture import GaussianMixture
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from evaluation import pattern_scores, streamed_scores
+from patterns import (fit_pattern_gmm, fit_pattern_kmeans, fit_pattern_ward, pattern_histogram,
+                      pattern_ward_linkage, row_merge_distances)
+
+
+def scaled_rows(n_rows, n_patterns, seed=0):
+    """Scaled document columns plus a completeness column, drawn from n_patterns distinct rows."""
+    rng = np.random.default_rng(seed)
+    docs = rng.integers(0, 2, size=(n_patterns, 12))
+    docs = np.unique(docs, axis=0)
+    docs = docs[rng.integers(0, len(docs), size=n_rows)]
+    completeness = docs @ rng.uniform(0.5, 2.0, size=12)
+    return StandardScaler().fit_transform(np.column_stack([docs, completeness]))
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return scaled_rows(600, 40)
+
+
+@pytest.fixture(scope="module")
+def few_rows():
+    # 4 patterns, so 6 clusters can only be made by splitting identical rows
+    return scaled_rows(60, 4, seed=1)
+
+
+@pytest.mark.parametrize("n_clusters", [2, 3, 5])
+def test_kmeans_matches_rows(rows, n_clusters):
+    _, labels = fit_pattern_kmeans(pattern_histogram(rows), n_clusters, random_state=42)
+    expected = KMeans(n_clusters=n_clusters, random_state=42).fit_predict(rows)
+    np.testing.assert_array_equal(labels, expected)
+
+
+@pytest.mark.parametrize("n_components", [2, 3, 5])
+def test_gmm_matches_rows(rows, n_components):
+    gmm, labels = fit_pattern_gmm(pattern_histogram(rows), n_components, random_state=42)
+    expected = GaussianMixture(n_components=n_components, covariance_type="tied", random_state=42).fit(rows)
+    np.testing.assert_array_equal(labels, expected.predict(rows))
+    np.testing.assert_array_equal(gmm.predict(rows), labels)
+    X_patterns, counts, _ = pattern_histogram(rows)
+    np.testing.assert_allclose(gmm.bic(X_patterns, sample_weight=counts), expected.bic(rows), rtol=1e-9)
+    # The completeness column is a sum of the documents, so the precisions are
+    # large (1 / reg_covar) and their smallest entries are rounding noise
+    np.testing.assert_allclose(gmm.precisions_, expected.precisions_, atol=1e-9 * np.abs(expected.precisions_).max())
+
+
+@pytest.mark.parametrize("n_clusters", [2, 3, 5])
+def test_ward_matches_rows(rows, n_clusters):
+    patterns = pattern_histogram(rows)
+    linkage_matrix, labels = fit_pattern_ward(patterns, n_clusters)
+    expected = AgglomerativeClustering(n_clusters=n_clusters, linkage="ward").fit_predict(rows)
+    np.testing.assert_array_equal(labels, expected)
+    np.testing.assert_allclose(row_merge_distances(linkage_matrix, len(rows)), ward(rows)[:, 2],
+                               rtol=1e-9, atol=1e-12)
+
+
+def test_ward_reuses_linkage(rows):
+    patterns = pattern_histogram(rows)
+    linkage_matrix = pattern_ward_linkage(patterns)
+    for n_clusters in (2, 4):
+        _, labels = fit_pattern_ward(patterns, n_clusters, linkage_matrix=linkage_matrix)
+        np.testing.assert_array_equal(labels, fit_pattern_ward(patterns, n_clusters)[1])
+
+
+def test_scores_match_rows(rows):
+    labels = KMeans(n_clusters=4, random_state=42).fit_predict(rows)
+    expected = (silhouette_score(rows, labels), calinski_harabasz_score(rows, labels),
+                davies_bouldin_score(rows, labels))
+    np.testing.assert_allclose(pattern_scores(pattern_histogram(rows), labels), expected, rtol=1e-8)
+    # CH and DB are exact when streamed; the silhouette covers every row here
+    np.testing.assert_allclose(streamed_scores(rows, labels, batch_rows=128), expected, rtol=1e-8)
+
+
+def test_scores_reject_one_label(rows):
+    with pytest.raises(ValueError, match="Number of labels is 1"):
+        pattern_scores(pattern_histogram(rows), np.zeros(len(rows), dtype=int))
+
+
+def test_fewer_patterns_than_clusters(few_rows):
+    patterns = pattern_histogram(few_rows)
+    assert len(patterns[0]) < 6
+
+    _, labels = fit_pattern_kmeans(patterns, 6, random_state=42)
+    np.testing.assert_array_equal(labels, KMeans(n_clusters=6, random_state=42).fit_predict(few_rows))
+
+    _, labels = fit_pattern_gmm(patterns, 6, random_state=42)
+    expected = GaussianMixture(n_components=6, covariance_type="tied", random_state=42).fit(few_rows)
+    np.testing.assert_array_equal(labels, expected.predict(few_rows))
+
+    # Which identical rows are split off is arbitrary (both cuts are at distance
+    # 0); each must still give 6 clusters, none of them mixing two patterns
+    linkage_matrix, labels = fit_pattern_ward(patterns, 6)
+    expected = AgglomerativeClustering(n_clusters=6, linkage="ward").fit_predict(few_rows)
+    for cut in (labels, expected):
+        assert len(np.unique(cut)) == len(np.unique(cut * len(patterns[0]) + patterns[2])) == 6
+    np.testing.assert_allclose(row_merge_distances(linkage_matrix, len(few_rows)), ward(few_rows)[:, 2],
+                               atol=1e-12)
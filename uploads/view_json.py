@@ -0,0 +1,49 @@
+# ==============================
+# COMPACT JSON COPIES OF THE data_view TABLES
+# ==============================
+
+# Next to every data_view*.xlsx, prepare_data.py writes a pre-gzipped,
+# column-oriented JSON copy (data_view*.json.gz) that the map page renders
+# directly, so the browser no longer decodes a workbook with SheetJS. The xlsx
+# files are kept for the download links.
+#
+# Layout: {"columns": [header...], "types": ["string"|"number"...],
+#          "rows": n, "data": [[values of column 0], [values of column 1], ...]}
+
+import gzip
+import json
+import os
+
+JSON_SUFFIX = ".json.gz"
+
+
+def json_path_for(xlsx_path):
+    """Return the JSON copy that belongs to a view (data_view_lokasi.xlsx -> data_view_lokasi.json.gz)."""
+    return os.path.splitext(xlsx_path)[0] + JSON_SUFFIX
+
+
+def view_payload(df):
+    """Column-oriented, JSON-ready form of a view (tolist() yields plain Python values)."""
+    return {
+        "columns": [str(col) for col in df.columns],
+        "types": ["number" if df[col].dtype.kind in "biuf" else "string" for col in df.columns],
+        "rows": len(df),
+        "data": [df[col].tolist() for col in df.columns],
+    }
+
+
+def write_view_json(df, file_path):
+    """Write the gzipped JSON copy of a view, atomically and with reproducible bytes."""
+    write_json_gz(view_payload(df), file_path)
+
+
+def write_json_gz(payload, file_path):
+    """Write `payload` as compact gzipped JSON, atomically and with reproducible bytes."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    tmp_file = file_path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        # mtime=0 keeps the bytes identical for identical data
+        with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+            gz.write(body)
+    os.replace(tmp_file, file_path)
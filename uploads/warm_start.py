@@ -0,0 +1,37 @@
+# ==============================
+# WARM START FROM THE SAVED MODEL
+# ==============================
+
+# Uploads drift only a little from month to month, so the centers of the last
+# saved K-Means model are a good starting point for the next fit. They live in
+# the scaled space of the scaler they were trained with, which the trainers
+# save next to the model; load_warm_start maps them through that scaler into
+# the current one, and the refit runs a single initialization from them.
+
+import joblib
+import numpy as np
+
+
+def scaler_path_for(model_file):
+    """The scaler saved with a model (kmeans_model.pkl -> kmeans_model_scaler.pkl)."""
+    root, ext = model_file.rsplit(".", 1)
+    return f"{root}_scaler.{ext}"
+
+
+def load_warm_start(model_file, scaler, n_clusters):
+    """
+    Centers of the saved model expressed in the scaling of `scaler`.
+
+    Returns None when there is nothing to start from: no saved model or
+    scaler, or a model with another number of clusters or features.
+    """
+    try:
+        model = joblib.load(model_file)
+        previous_scaler = joblib.load(scaler_path_for(model_file))
+    except (OSError, ValueError, EOFError, AttributeError, ImportError):
+        return None
+    centers = getattr(model, "cluster_centers_", None)
+    if centers is None or centers.shape != (n_clusters, len(scaler.mean_)) or len(previous_scaler.mean_) != len(scaler.mean_):
+        return None
+    # Back to feature units with the old scaler, then standardized with the current one
+    return (np.asarray(centers) * previous_scaler.scale_ + previous_scaler.mean_ - scaler.mean_) / scaler.scale_